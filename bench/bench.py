@@ -0,0 +1,212 @@
+"""Benchmarks for vdb's hot paths, driving headless sessions against the
+scripted debugger in fakepdb.py, with the stand-in vim module from this
+directory in place of Vim's.
+
+	python bench/bench.py [--steps N] [--watches N] [--lines N] [--depth N]
+	    [--breaks N] [--restarts N] [--repr N] [--remote ADDRESS] [--gdb]
+
+Reports stepping rate, watch refresh latency, process output throughput,
+breakpoint setup and configuration time, session start time with and without
+a standby and autoresponse parsing throughput, so regressions show up as
+numbers. With --remote, sessions go through a vdbagent.py listening at
+ADDRESS instead. With --gdb, they are gdb/MI sessions against fakegdb.py."""
+
+import optparse
+import os
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(1, os.path.dirname(here))
+
+import vim
+import vdb
+
+class TBenchUI(vdb.TSessionUI):
+	"""counts stops and collects program output into a buffer the way the
+	[Process Output] window does"""
+	def __init__(self):
+		self.stops = 0
+		self.output = vim.TBuffer("[Process Output]")
+
+	def showoutput(self, session, output):
+		vdb.VDBAppendOutput(self.output, output)
+
+	def showexecution(self, session, filename, lineno, result=None, error=None):
+		self.stops += 1
+
+def fakeinterface(options, chatter=0, burst=0):
+	if options.gdb:
+		interface = dict(vdb.interface[1])
+		(script, args) = ("fakegdb.py", "%(VDBSourceFile)s")
+	else:
+		interface = dict(vdb.interface[0])
+		(script, args) = ("fakepdb.py", "%(VDBSourceFile)s %(VDBArgs)s")
+	interface["exec"] = "%s %s --depth %i --repr %i --chatter %i --burst %i %s"%(sys.executable, os.path.join(here, script), options.depth, options.repr, chatter, burst, args)
+	return interface
+
+def newsession(interface, filename, ui):
+	return getattr(vdb, interface["session"])(interface, filename, "", ui)
+
+def startsession(options, chatter=0, burst=0):
+	interface = fakeinterface(options, chatter, burst)
+	ui = TBenchUI()
+	session = newsession(interface, os.path.abspath(__file__), ui)
+	session.process()
+	return (session, ui)
+
+def report(name, value, unit):
+	print("%-28s %12.1f %s"%(name, value, unit))
+
+def benchsteps(options):
+	(session, ui) = startsession(options)
+	started = time.time()
+	for i in range(options.steps):
+		session.writeline(session.interface["nextcommand"])
+		session.process()
+	elapsed = time.time()-started
+	session.close()
+	report("steps", options.steps/elapsed, "steps/s")
+
+def benchwatches(options):
+	(session, ui) = startsession(options)
+	watches = [("watch%i"%(i), 1) for i in range(options.watches)]
+	session.evalwatches(watches)
+	started = time.time()
+	for i in range(options.refreshes):
+		session.evalwatches(watches)
+	elapsed = time.time()-started
+	session.close()
+	report("watch refresh (%i watches)"%(options.watches), elapsed/options.refreshes*1000, "ms")
+
+def benchoutput(options):
+	(session, ui) = startsession(options, burst=options.lines)
+	started = time.time()
+	session.writeline(session.interface["continuecommand"])
+	session.process()
+	while len(ui.output) <= options.lines:
+		output = session.getoutput()
+		if output is not None:
+			ui.showoutput(session, output)
+	elapsed = time.time()-started
+	session.close()
+	report("process output", options.lines/elapsed, "lines/s")
+
+def benchwhere(options):
+	(session, ui) = startsession(options)
+	started = time.time()
+	for i in range(options.refreshes):
+		session.backtrace()
+	elapsed = time.time()-started
+	session.close()
+	report("backtrace (%i frames)"%(options.depth), elapsed/options.refreshes*1000, "ms")
+
+def benchbreaks(options):
+	(session, ui) = startsession(options)
+	locations = ["%s:%i"%(os.path.abspath(__file__), line+1) for line in range(options.breaks)]
+	started = time.time()
+	session.setbreakpoints(locations)
+	elapsed = time.time()-started
+	session.close()
+	report("breakpoints (%i)"%(options.breaks), elapsed*1000, "ms")
+
+def benchconfigure(options):
+	"""gives the breakpoints conditions, hit counts and log messages in turn,
+	which an MI session does by deleting and inserting each one again"""
+	(session, ui) = startsession(options)
+	filename = os.path.abspath(__file__)
+	numbers = session.setbreakpoints(["%s:%i"%(filename, line+1) for line in range(options.breaks)])
+	breakpoints = []
+	for (line, number) in enumerate(numbers):
+		breakpoint = vdb.TBreakpoint(line, filename, line+1)
+		if line%3 == 0:
+			breakpoint.condition = "i > %i"%(line)
+		elif line%3 == 1:
+			breakpoint.hits = line
+		else:
+			breakpoint.log = "line %i, i is {i}"%(line+1)
+		breakpoints.append((number, breakpoint))
+	started = time.time()
+	numbers = session.configure(breakpoints)
+	elapsed = time.time()-started
+	session.close()
+	if None in numbers:
+		print("breakpoint options: %i of %i refused"%(numbers.count(None), len(numbers)))
+	report("breakpoint options (%i)"%(options.breaks), elapsed*1000, "ms")
+
+def benchrestart(options):
+	interface = fakeinterface(options)
+	filename = os.path.abspath(__file__)
+	cold = warm = 0.0
+	for i in range(options.restarts):
+		started = time.time()
+		session = newsession(interface, filename, TBenchUI())
+		session.process()
+		cold += time.time()-started
+		session.close()
+		standby = vdb.TStandby(interface, filename, "", False)
+		standby.join()
+		started = time.time()
+		session = standby.take(TBenchUI())
+		session.process()
+		warm += time.time()-started
+		session.close()
+	report("session start", cold/options.restarts*1000, "ms")
+	report("session start from standby", warm/options.restarts*1000, "ms")
+
+def benchparse(options):
+	filename = os.path.abspath(__file__)
+	lines = []
+	if options.gdb:
+		frames = ['frame={level="%i",addr="0x%x",func="f%i",file="bench.py",fullname=%s,line="%i"}'%(depth, depth+1, depth, vdb.VDBQuoteMI(filename), depth+1) for depth in range(options.depth)]
+		lines += ["^done,stack=[%s]"%(",".join(frames)), "(gdb) "]
+		lines += ['*stopped,reason="end-stepping-range",%s,thread-id="1",stopped-threads="all"'%(frames[0]), "(gdb) "]
+		lines += ['^done,bkpt={number="1",type="breakpoint",fullname=%s,line="10",thread-groups=["i1"],times="0"}'%(vdb.VDBQuoteMI(filename)), "(gdb) "]
+		lines += ['^error,msg="No symbol \\"x\\" in current context."', '~"VDBLog i is 1\\n"', "program output"]
+	else:
+		for depth in range(options.depth):
+			lines.append("  %s(%i)f%i()"%(filename, depth+1, depth))
+			lines.append("-> pass")
+		lines += ["--Call--", "Breakpoint 1 at %s:10"%(filename), "*** NameError: name 'x' is not defined", "program output"]
+	autoresponse = vdb.VDBGetAutoresponse(fakeinterface(options))
+	started = time.time()
+	for i in range(options.refreshes):
+		for line in lines:
+			autoresponse.match(line)
+	elapsed = time.time()-started
+	report("autoresponse matching", len(lines)*options.refreshes/elapsed, "lines/s")
+	if options.gdb:
+		started = time.time()
+		for i in range(options.refreshes):
+			for line in lines:
+				vdb.VDBParseMIRecord(line)
+		elapsed = time.time()-started
+		report("MI record parsing", len(lines)*options.refreshes/elapsed, "lines/s")
+
+def main():
+	parser = optparse.OptionParser()
+	parser.add_option("--steps", type="int", default=500, help="steps to time")
+	parser.add_option("--watches", type="int", default=20, help="watches to refresh")
+	parser.add_option("--refreshes", type="int", default=200, help="watch refreshes, backtraces and parse passes to time")
+	parser.add_option("--lines", type="int", default=100000, help="lines of program output to time")
+	parser.add_option("--depth", type="int", default=50, help="frames in a backtrace")
+	parser.add_option("--breaks", type="int", default=500, help="breakpoints to set at session start")
+	parser.add_option("--restarts", type="int", default=20, help="session starts to time, with and without a standby")
+	parser.add_option("--repr", type="int", default=1000, help="characters in a value")
+	parser.add_option("--remote", help="address of a vdbagent.py to debug through")
+	parser.add_option("--gdb", action="store_true", default=False, help="time gdb/MI sessions against fakegdb.py")
+	(options, args) = parser.parse_args()
+	vdb.VDBOutputMaxLines = 0
+	vdb.VDBRemote = options.remote
+
+	benchsteps(options)
+	benchwatches(options)
+	benchoutput(options)
+	benchwhere(options)
+	benchbreaks(options)
+	benchconfigure(options)
+	benchrestart(options)
+	benchparse(options)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,147 @@
+"""A scripted stand-in for 'gdb --interpreter=mi2', answering vdb's MI
+commands with records like gdb's, whose size can be turned up, so the MI
+session's parsing, variable objects and breakpoint handling can be measured
+without gdb or a compiled program.
+
+	fakegdb.py [--depth N] [--repr N] [--chatter N] [--burst N] file
+
+file is taken for the program's only source file. --depth is the number of
+frames -stack-list-frames reports, --repr the length of each variable
+object's value, --chatter the number of lines the "program" prints per step,
+and --burst the number it prints on -exec-continue."""
+
+import optparse
+import os
+import re
+import sys
+
+#an MI argument, quoted C style or bare
+argument = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+
+def quote(text):
+	return '"%s"'%(text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+
+def main():
+	parser = optparse.OptionParser()
+	parser.add_option("--depth", type="int", default=50)
+	parser.add_option("--repr", type="int", default=1000)
+	parser.add_option("--chatter", type="int", default=0)
+	parser.add_option("--burst", type="int", default=1000)
+	(options, args) = parser.parse_args()
+
+	filename = os.path.abspath(args[0])
+	try:
+		length = len(open(filename).readlines())
+	except IOError:
+		length = 0
+	length = max(length, 1)
+	state = {"line": 1, "breaks": 0, "steps": 0}
+	variables = {}
+	output = []
+
+	def write(text):
+		sys.stdout.write(text+"\n")
+
+	def reply(record):
+		write(record)
+		write("(gdb) ")
+
+	def frame(line, level=None):
+		fields = 'addr="0x%x",func="f%i",file="%s",fullname=%s,line="%i"'%(line, level or 0, os.path.basename(filename), quote(filename), line)
+		if level is not None:
+			fields = 'level="%i",%s'%(level, fields)
+		return "{%s}"%(fields)
+
+	def run(line, reason, lines=0):
+		reply("^running")
+		write('*running,thread-id="all"')
+		if len(output) > 0:
+			for i in range(lines):
+				output[0].write("program output line %i of %i\n"%(i, lines))
+			output[0].flush()
+		state["line"] = (line-1)%length+1
+		state["steps"] += 1
+		reply('*stopped,reason="%s",frame=%s,thread-id="1",stopped-threads="all"'%(reason, frame(state["line"])))
+
+	def value(name):
+		return ("%i:%s"%(state["steps"], name)+"x"*options.repr)[:options.repr]
+
+	def breakpoint(kind, words):
+		#the location comes after the options, -c and -i take a value
+		i = 1
+		while words[i].startswith("-"):
+			i += 1+(words[i] in ["-c", "-i"])
+		location = words[i]
+		m = re.search(r":(\d+)$", location)
+		if m is None:
+			reply('^error,msg="Function \\"%s\\" not defined."'%(location))
+			return
+		state["breaks"] += 1
+		reply('^done,bkpt={number="%i",type="%s",disp="keep",enabled="y",addr="0x1",file="%s",fullname=%s,line="%s",thread-groups=["i1"],times="0"}'%(state["breaks"], kind, os.path.basename(filename), quote(filename), m.group(1)))
+
+	write('=thread-group-added,id="i1"')
+	write("(gdb) ")
+	sys.stdout.flush()
+	while True:
+		line = sys.stdin.readline()
+		if line == "":
+			break
+		command = line.strip()
+		if command == "":
+			continue
+		words = [bare or quoted.decode("string_escape") for (quoted, bare) in argument.findall(command)]
+		word = words[0]
+		if word == "-exec-arguments":
+			if ">" in words:
+				output.append(open(words[words.index(">")+1], "w"))
+			reply("^done")
+		elif word == "-exec-run":
+			run(1, "breakpoint-hit")
+		elif word in ["-exec-next", "-exec-step"]:
+			count = 1
+			if len(words) > 1:
+				count = int(words[1])
+			run(state["line"]+count, "end-stepping-range", options.chatter*count)
+		elif word == "-exec-continue":
+			run(state["line"]+10, "breakpoint-hit", options.burst)
+		elif word == "-exec-finish":
+			run(state["line"]+1, "function-finished")
+		elif word == "-exec-until":
+			m = re.search(r":(\d+)$", words[-1])
+			if m is None:
+				run(state["line"]+1, "location-reached")
+			else:
+				run(int(m.group(1)), "location-reached")
+		elif word == "-break-insert":
+			breakpoint("breakpoint", words)
+		elif word == "-dprintf-insert":
+			breakpoint("dprintf", words)
+		elif word == "-var-create":
+			variables[words[1]] = words[3]
+			reply('^done,name="%s",numchild="20",value=%s,type="int",has_more="0"'%(words[1], quote(value(words[1]))))
+		elif word == "-var-update":
+			changes = ['{name="%s",value=%s,in_scope="true",type_changed="false",has_more="0"}'%(name, quote(value(name))) for name in sorted(variables)]
+			reply("^done,changelist=[%s]"%(",".join(changes)))
+		elif word == "-var-delete":
+			variables.pop(words[-1], None)
+			reply('^done,ndeleted="1"')
+		elif word == "-var-list-children":
+			children = ['child={name="%s.%i",exp="%i",numchild="0",type="int"}'%(words[-1], i, i) for i in range(20)]
+			reply('^done,numchild="20",children=[%s],has_more="0"'%(",".join(children)))
+		elif word == "-var-info-path-expression":
+			(parent, child) = words[-1].rsplit(".", 1)
+			reply("^done,path_expr=%s"%(quote("(%s)[%s]"%(variables.get(parent, parent), child))))
+		elif word == "-stack-list-frames":
+			frames = ["frame=%s"%(frame((state["line"]+depth-1)%length+1, depth)) for depth in range(options.depth)]
+			reply("^done,stack=[%s]"%(",".join(frames)))
+		elif word in ["-gdb-set", "-break-delete", "-break-condition", "-break-after"]:
+			reply("^done")
+		elif word == "-gdb-exit":
+			reply("^exit")
+			return
+		else:
+			reply('^error,msg=%s'%(quote('Undefined MI command: %s'%(word[1:]))))
+		sys.stdout.flush()
+
+if __name__ == "__main__":
+	main()
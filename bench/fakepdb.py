@@ -0,0 +1,96 @@
+"""A scripted stand-in for 'python -m pdb', answering vdb's commands with
+pdb-like transcripts whose size can be turned up, so the session's hot paths
+can be measured without a real program being debugged.
+
+	fakepdb.py [--depth N] [--repr N] [--chatter N] [--burst N] file [args]
+
+--depth is the number of frames 'where' prints, --repr the length of what 'p'
+prints and of each watch value, --chatter the number of lines the "program"
+prints per step, and --burst the number it prints on 'continue'."""
+
+import optparse
+import os
+import re
+import sys
+
+def main():
+	parser = optparse.OptionParser()
+	parser.add_option("--depth", type="int", default=50)
+	parser.add_option("--repr", type="int", default=1000)
+	parser.add_option("--chatter", type="int", default=0)
+	parser.add_option("--burst", type="int", default=1000)
+	(options, args) = parser.parse_args()
+
+	filename = os.path.abspath(args[0])
+	try:
+		source = [line.rstrip("\n") for line in open(filename)]
+	except IOError:
+		source = []
+	if len(source) == 0:
+		source = ["pass"]
+	state = {"line": 1, "breaks": 0}
+	output = []
+
+	def write(text):
+		sys.stdout.write(text)
+
+	def stop(line):
+		state["line"] = (line-1)%len(source)+1
+		write("> %s(%i)<module>()\n-> %s\n"%(filename, state["line"], source[state["line"]-1].strip()))
+
+	def program(lines):
+		if len(output) > 0:
+			for i in range(lines):
+				output[0].write("program output line %i of %i\n"%(i, lines))
+			output[0].flush()
+
+	stop(1)
+	while True:
+		write("(Pdb) ")
+		sys.stdout.flush()
+		line = sys.stdin.readline()
+		if line == "":
+			break
+		for command in line.strip().split(";;"):
+			command = command.strip()
+			word = command.split(" ")[0]
+			if command.startswith("VDBSplitStreams("):
+				output.append(open(re.search("VDBSplitStreams\\('([^']+)'", command).group(1), "w"))
+			elif command.startswith("!VDBEvalWatches("):
+				m = re.match("!VDBEvalWatches\\((\\[.*\\]), \\((\\d+), \\d+, \\d+\\)\\)$", command)
+				if m is not None:
+					state["watches"] = re.findall("\\('((?:[^'\\\\]|\\\\.)*)', (\\d+)\\)", m.group(1))
+					state["maxchars"] = int(m.group(2))
+				for (i, (watch, page)) in enumerate(state.get("watches", [])):
+					size = min(options.repr, state["maxchars"]*int(page))
+					write("VDBWatch %i ok '%s'%s\n"%(i, "x"*size, ["", "..."][size < options.repr]))
+			elif command.startswith("!VDBWatchChildren("):
+				for i in range(20):
+					write("VDBChild child[%i]\n"%(i))
+			elif word in ["n", "next", "s", "step"]:
+				program(options.chatter)
+				stop(state["line"]+1)
+			elif word in ["c", "cont", "continue"]:
+				program(options.burst)
+				stop(state["line"]+10)
+			elif word in ["r", "return"]:
+				write("--Return--\n")
+				stop(state["line"]+1)
+			elif word in ["w", "where", "bt"]:
+				for depth in range(options.depth):
+					write("  %s(%i)f%i()\n-> %s\n"%(filename, depth+1, depth, source[depth%len(source)].strip()))
+				stop(state["line"])
+			elif word in ["p", "pp", "print"]:
+				write("[%s]\n"%(", ".join(["0"]*(options.repr//3))))
+			elif word in ["b", "break", "tbreak"]:
+				state["breaks"] += 1
+				write("Breakpoint %i at %s\n"%(state["breaks"], command.split(" ", 1)[1]))
+			elif word in ["cl", "clear"]:
+				write("Deleted breakpoint %i\n"%(state["breaks"]))
+			elif word == "condition":
+				write("New condition set for breakpoint %s.\n"%(command.split(" ")[1]))
+			elif word in ["q", "quit"]:
+				return
+
+if __name__ == "__main__":
+	main()
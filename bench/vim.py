@@ -0,0 +1,44 @@
+"""A stand-in for the vim module that Vim provides to its python interpreter,
+with just enough in it for vdb.py to be imported and its sessions driven
+outside of Vim. Ex commands are recorded instead of run, and every eval()
+comes back as "0" unless it has been set in evals."""
+
+commands = []
+evals = {}
+
+class error(Exception):
+	pass
+
+class TBuffer(list):
+	def __init__(self, name="", number=1):
+		list.__init__(self, [""])
+		self.name = name
+		self.number = number
+
+	def append(self, lines, *where):
+		if isinstance(lines, list):
+			self.extend(lines)
+		else:
+			list.append(self, lines)
+
+class TWindow(object):
+	def __init__(self, buffer):
+		self.buffer = buffer
+		self.cursor = (1, 0)
+		self.height = 50
+
+class TCurrent(object):
+	def __init__(self):
+		self.buffer = TBuffer()
+		self.window = TWindow(self.buffer)
+		self.line = ""
+
+current = TCurrent()
+windows = [current.window]
+buffers = [current.buffer]
+
+def command(cmd):
+	commands.append(cmd)
+
+def eval(expr):
+	return evals.get(expr, "0")
@@ -1,116 +1,1134 @@
 import math
+import errno
+import collections
 import pty
 import sys
 import os
 import shlex
 import fcntl
+import itertools
 import time
 import re
+import linecache
+import json
+import select
+import signal
+import socket
+import struct
+import zlib
+import threading
 import vim
 import tty
 
 VDB_DEBUG = False
+VDBDebugFile = None
+#every user command's phases are timed for :VDBStats, if this is set to a file
+#name a JSON line per command is also appended to it
+VDBTraceFile = None
+VDBReadChunk = 65536
+#commands sent together are chained into lines no longer than this, which
+#keeps them under the terminal's line length limit
+VDBBatchMaxChars = 4000
+#seconds to wait for the debugger prompt before assuming the debugged process
+#is busy or waiting for input
+VDBTimeout = 5.0
+#the [Process Output] buffer drops its oldest lines beyond this many, 0 keeps
+#everything
+VDBOutputMaxLines = 10000
+#the same for the [Log] window, where logpoints' messages go
+VDBLogMaxLines = 10000
+#watch values are shown as a bounded repr, each extra page fetched for a watch
+#allows this many more characters and container items, and one more level of
+#nesting
+VDBWatchMaxChars = 200
+VDBWatchMaxItems = 20
+VDBWatchMaxDepth = 3
+#lines of debugger console transcript kept in memory, older lines are appended
+#to the VDBConsoleSpill file if it is set, or forgotten otherwise
+VDBConsoleMaxLines = 5000
+VDBConsoleSpill = None
+#run the debugged program in the background, with a thread waiting for it to
+#stop, so Vim stays usable in the meantime. Needs a Vim with +timers, which is
+#polled every VDBPollInterval milliseconds for the program having stopped
+VDBBackground = True
+VDBPollInterval = 50
+#breakpoints are kept in this file, relative to Vim's working directory when
+#they are first needed, between Vim sessions, None keeps them only until Vim exits
+VDBBreakpointFile = ".vdbbreakpoints"
+#keep a spare debugger started in the background on the program and arguments
+#of the last session, so starting the next session only has to take it over,
+#the modules in VDBPreimports are imported into it up front
+VDBStandby = False
+VDBPreimports = []
+#under pdb, only trace the functions that have breakpoints in them while the
+#program continues, so it runs at close to full speed between them. Stepping
+#is traced as usual either way
+VDBFastTracer = True
+#debug through a vdbagent.py running where the program is, at this host:port
+#or unix socket path, instead of starting the debugger here. Frames to and
+#from it at least VDBCompressMin bytes long are compressed
+VDBRemote = None
+VDBCompressMin = 1024
+
+#the debugged program's stdout goes to a block buffered fifo and pdb keeps the
+#terminal, sys.stdout is switched over whenever the debugger takes or gives
+#back control, so writes from the program never pay for working out who made them
+pdbstreams = """
+def VDBSplitStreams(path):
+	import sys
+	import pdb
+	frame = sys._getframe(1)
+	while not isinstance(frame.f_locals.get('self'), pdb.Pdb):
+		frame = frame.f_back
+	debugger = frame.f_locals['self']
+	debugout = sys.stdout
+	processout = open(path, 'w')
+	#the program's own sys.stdout while the debugger has it, None when the
+	#program has it, which goes back as it was unless it was the terminal
+	held = [None]
+
+	def todebugger():
+		processout.flush()
+		VDBLog.flush()
+		if held[0] is None:
+			held[0] = sys.stdout
+		sys.stdout = debugout
+
+	def toprocess():
+		if held[0] is None or held[0] is debugout:
+			sys.stdout = processout
+		else:
+			sys.stdout = held[0]
+		held[0] = None
+
+	def stopping(name):
+		def stop(self, frame, *args):
+			if frame.f_code is setting.func_code:
+				#stepped off the end of the program into the hook below, let it
+				#finish rather than stopping in there
+				self.set_continue()
+				return
+			todebugger()
+			try:
+				return getattr(base, name)(self, frame, *args)
+			finally:
+				toprocess()
+		return stop
+
+	def setting(self, name, value):
+		self.__dict__[name] = value
+		#bdb sets this once the program has finished, including the run that
+		#is already under way, pdb then reports it on its own stdout
+		if name == 'quitting' and value:
+			todebugger()
+
+	def resumed():
+		del debugger.postloop
+		toprocess()
+
+	base = debugger.__class__
+	methods = {'__setattr__': setting}
+	for name in ['user_call', 'user_line', 'user_return', 'user_exception']:
+		methods[name] = stopping(name)
+	debugger.__class__ = type(base)('VDBPdb', (base,), methods)
+	#we are already stopped, so hand over when this command loop ends
+	debugger.postloop = resumed
+
+import __builtin__
+__builtin__.VDBSplitStreams = VDBSplitStreams
+"""
 
-tpipesplit = """
-class TPipeSplit(object):
-	def __init__(self, debugout, processout):
-		self.debugout = debugout
-		self.processout = processout
-		#self.dump = open('vdb.debug', 'w')
-	
-	def write(self, buf):
-		#self.dump.write('%r: %r\\n'%(os.path.basename(sys._getframe(1).f_code.co_filename), buf))
-		#self.dump.flush()
-		if os.path.basename(sys._getframe(1).f_code.co_filename) in ['cmd.py', 'pdb.py', 'bdb.py', '<stdin>']:
-			self.debugout.write(buf)
+pdbwatches = """
+def VDBEvalWatches(watches=None, limits=None):
+	import sys
+	import repr as reprlib
+	if watches is not None:
+		VDBEvalWatches.watches = [(w.decode('base64'), page) for (w, page) in watches]
+	if limits is not None:
+		VDBEvalWatches.limits = limits
+	(maxchars, maxitems, maxdepth) = VDBEvalWatches.limits
+	frame = sys._getframe(1)
+	r = reprlib.Repr()
+	for (i, (w, page)) in enumerate(VDBEvalWatches.watches):
+		for attr in ['maxlist', 'maxtuple', 'maxdict', 'maxset', 'maxfrozenset', 'maxdeque', 'maxarray']:
+			setattr(r, attr, maxitems*page)
+		r.maxstring = r.maxother = r.maxlong = maxchars*page
+		r.maxlevel = maxdepth+page-1
+		try:
+			result = r.repr(eval(w, frame.f_globals, frame.f_locals))
+			if len(result) > maxchars*page:
+				result = result[:maxchars*page]+'...'
+			status = 'ok'
+		except:
+			(t, v) = sys.exc_info()[:2]
+			result = '*** %s: %s'%(getattr(t, '__name__', t), v)
+			status = 'error'
+		sys.__stdout__.write('VDBWatch %i %s %s\\n'%(i, status, result.replace('\\n', '\\\\n')))
+	sys.__stdout__.flush()
+VDBEvalWatches.watches = []
+VDBEvalWatches.limits = (200, 20, 3)
+
+def VDBWatchChildren(w, maxitems):
+	import sys
+	import re
+	w = w.decode('base64')
+	frame = sys._getframe(1)
+	children = []
+	try:
+		value = eval(w, frame.f_globals, frame.f_locals)
+		if not re.match('^[\\\\w.]+(\\\\[[^]]*\\\\])*$', w):
+			w = '(%s)'%(w)
+		if isinstance(value, dict):
+			children = ['%s[%r]'%(w, k) for k in list(value)[:maxitems]]
+		elif isinstance(value, (list, tuple)):
+			children = ['%s[%i]'%(w, i) for i in range(min(len(value), maxitems))]
+		else:
+			children = ['%s.%s'%(w, a) for a in sorted(getattr(value, '__dict__', {}))[:maxitems]]
+	except:
+		pass
+	for c in children:
+		sys.__stdout__.write('VDBChild %s\\n'%(c.replace('\\n', '\\\\n')))
+	sys.__stdout__.flush()
+
+import __builtin__
+__builtin__.VDBEvalWatches = VDBEvalWatches
+__builtin__.VDBWatchChildren = VDBWatchChildren
+"""
+
+#commands pdb doesn't have, added to the debugger's class. "vdbuntil file:line"
+#continues to a line through a temporary breakpoint, which goes again at the
+#next stop wherever that is, unless there was a breakpoint there already.
+#"vdbrepeat count step|next" steps count times before saying where it has got
+#to, going on into a call like F7 does, and stopping early at a breakpoint, an
+#exception or the end of the program. SIGINT, which :VDBInterrupt sends, stops
+#the program at the next line it runs, as pdb does in python 3, instead of
+#raising KeyboardInterrupt in it
+pdbcommands = """
+def VDBAddCommands():
+	import sys
+	import pdb
+	import bdb
+	import signal
+	frame = sys._getframe(1)
+	while not isinstance(frame.f_locals.get('self'), pdb.Pdb):
+		frame = frame.f_back
+	debugger = frame.f_locals['self']
+
+	def until(self, arg):
+		(filename, line) = arg.rsplit(':', 1)
+		if len(self.get_breaks(self.canonic(filename), int(line))) == 0:
+			number = bdb.Breakpoint.next
+			self.do_tbreak(arg)
+			if bdb.Breakpoint.next == number:
+				print >>self.stdout, "*** Can't run to %s"%(arg)
+				return
+			self.untilbreak = number
+		return self.do_continue('')
+
+	def repeat(self, arg):
+		(count, command) = arg.split()
+		self.repeating = (int(count)-1, command)
+		return self.onecmd(command)
+
+	def stepped(self, frame, line=False):
+		(count, command) = self.repeating
+		#bdb only looks for a breakpoint on a line it wasn't stopping at anyway
+		if count <= 0 or not self.stop_here(frame) or frame.f_code.co_filename == '<string>' or (line and self.break_here(frame)):
+			self.repeating = (0, None)
+			return False
+		self.repeating = (count-1, command)
+		if command == 'step':
+			self.set_step()
+		else:
+			self.set_next(frame)
+		return True
+
+	def line(self, frame):
+		if not stepped(self, frame, True):
+			return base.user_line(self, frame)
+
+	def returning(self, frame, value):
+		if not stepped(self, frame):
+			return base.user_return(self, frame, value)
+
+	def calling(self, frame, args):
+		if self.repeating[0] > 0 and self.stop_here(frame) and frame.f_code.co_filename != '<string>':
+			#a step into a call goes on to its first line
+			self.set_next(frame)
+			return
+		return base.user_call(self, frame, args)
+
+	def exception(self, frame, info):
+		self.repeating = (0, None)
+		return base.user_exception(self, frame, info)
+
+	def interaction(self, frame, traceback):
+		if self.untilbreak is not None:
+			if bdb.Breakpoint.bpbynumber[self.untilbreak] is not None:
+				self.clear_bpbynumber(self.untilbreak)
+			self.untilbreak = None
+		self.interacting = True
+		try:
+			return base.interaction(self, frame, traceback)
+		finally:
+			self.interacting = False
+
+	def interrupted(signum, frame):
+		if debugger.interacting:
+			return
+		#unlike in a command, the debugger's own code would be traced in here,
+		#and its attributes changing taken for the program stepping
+		sys.settrace(None)
+		debugger.set_step()
+		sys.settrace(debugger.trace_dispatch)
+		#nor should this handler's frame be stopped in on its way out
+		del sys._getframe().f_trace
+		while frame is not None and frame is not debugger.botframe:
+			frame.f_trace = debugger.trace_dispatch
+			frame = frame.f_back
+
+	base = debugger.__class__
+	methods = {'do_vdbuntil': until, 'do_vdbrepeat': repeat, 'user_line': line, 'user_return': returning, 'user_call': calling, 'user_exception': exception, 'interaction': interaction}
+	debugger.__class__ = type(base)('VDBCommandsPdb', (base,), methods)
+	debugger.untilbreak = None
+	debugger.repeating = (0, None)
+	debugger.interacting = False
+	signal.signal(signal.SIGINT, interrupted)
+
+import __builtin__
+__builtin__.VDBAddCommands = VDBAddCommands
+"""
+
+#while continuing, bdb traces every line of every frame of a file with a
+#breakpoint in it, and looks at every call. This has calls only traced into
+#code objects with a breakpoint on one of their lines, and takes the trace off
+#the frames already running that have none, so the rest of the program runs
+#untraced until the next stop. Stepping puts bdb's tracing back everywhere
+pdbtracer = """
+def VDBTraceBreakpoints():
+	import sys
+	import pdb
+	import dis
+	frame = sys._getframe(1)
+	while not isinstance(frame.f_locals.get('self'), pdb.Pdb):
+		frame = frame.f_back
+	debugger = frame.f_locals['self']
+	#whether each code object has a breakpoint on one of its lines, worked out
+	#the first time it runs after the breakpoints change
+	traced = {}
+
+	def tracing(code):
+		found = traced.get(code)
+		if found is None:
+			lines = debugger.breaks.get(debugger.canonic(code.co_filename), [])
+			found = len(lines) > 0 and (code.co_firstlineno in lines or len([line for (offset, line) in dis.findlinestarts(code) if line in lines]) > 0)
+			traced[code] = found
+		return found
+
+	def calling(frame, event, arg):
+		found = traced.get(frame.f_code)
+		if found is None:
+			found = tracing(frame.f_code)
+		if found:
+			return debugger.trace_dispatch
+
+	def dispatch(self, frame, event, arg):
+		result = base.trace_dispatch(self, frame, event, arg)
+		if self.fast and not tracing(frame.f_code):
+			#the frame we continued from, whose trace set_continue took off
+			return None
+		return result
+
+	def continuing(self):
+		base.set_continue(self)
+		if not self.breaks:
+			return
+		self.fast = True
+		sys.settrace(calling)
+		frame = sys._getframe().f_back
+		while frame and frame is not self.botframe:
+			if tracing(frame.f_code):
+				frame.f_trace = self.trace_dispatch
+			else:
+				del frame.f_trace
+			frame = frame.f_back
+
+	def stepping(name):
+		def step(self, *args):
+			#tracing goes back on last, in case this is called from outside the
+			#tracer, where what it does would be traced
+			result = getattr(base, name)(self, *args)
+			if self.fast:
+				self.fast = False
+				sys.settrace(self.trace_dispatch)
+				frame = sys._getframe().f_back
+				while frame and frame is not self.botframe:
+					frame.f_trace = self.trace_dispatch
+					frame = frame.f_back
+			return result
+		return step
+
+	def changing(name):
+		def change(self, *args):
+			traced.clear()
+			return getattr(base, name)(self, *args)
+		return change
+
+	def resetting(self):
+		#a program that is run again starts out stepping, with its code new
+		self.fast = False
+		traced.clear()
+		return base.reset(self)
+
+	base = debugger.__class__
+	methods = {'trace_dispatch': dispatch, 'set_continue': continuing, 'reset': resetting}
+	for name in ['set_step', 'set_next', 'set_return', 'set_until']:
+		methods[name] = stepping(name)
+	for name in ['set_break', 'clear_break', 'clear_bpbynumber', 'clear_all_file_breaks', 'clear_all_breaks']:
+		methods[name] = changing(name)
+	debugger.__class__ = type(base)('VDBTracingPdb', (base,), methods)
+	debugger.fast = False
+
+import __builtin__
+__builtin__.VDBTraceBreakpoints = VDBTraceBreakpoints
+"""
+
+#a logpoint is a breakpoint whose pdb condition is VDBLog(number), which writes
+#the message and says not to stop, so a hit never leaves the program. Messages
+#are compiled once when set, and go to the terminal in batches, when enough
+#are waiting, the last batch went a while ago, or the debugger takes over
+pdblogs = """
+def VDBLog(number):
+	import sys
+	import time
+	frame = sys._getframe(1)
+	point = VDBLog.points[number]
+	(texts, fields, condition) = point[:3]
+	try:
+		if condition is not None and not eval(condition, frame.f_globals, frame.f_locals):
+			return False
+		#pdb never counts a hit of its own, the condition being false
+		if point[3] > 0:
+			point[3] -= 1
+			return False
+		values = []
+		for field in fields:
+			try:
+				values.append(str(eval(field, frame.f_globals, frame.f_locals)))
+			except:
+				(t, v) = sys.exc_info()[:2]
+				values.append('<%s: %s>'%(getattr(t, '__name__', t), v))
+	except:
+		(t, v) = sys.exc_info()[:2]
+		(texts, values) = (['*** condition failed, %s: %s'%(getattr(t, '__name__', t), v)], [])
+	message = texts[0]+''.join([value+text for (value, text) in zip(values, texts[1:])])
+	VDBLog.pending.append('VDBLog %s\\n'%(message.replace('\\n', '\\\\n')))
+	now = time.time()
+	if len(VDBLog.pending) >= 100 or now-VDBLog.flushed >= 0.1:
+		VDBLog.flush(now)
+	return False
+
+def VDBLogSet(number, message, condition, ignore):
+	import re
+	(message, condition) = (message.decode('base64'), condition.decode('base64'))
+	parts = re.split('{([^{}]*)}', message)
+	try:
+		fields = [compile(field, '<logpoint>', 'eval') for field in parts[1::2]]
+		if condition != '':
+			condition = compile(condition, '<condition>', 'eval')
 		else:
-			self.processout.write(buf)
+			condition = None
+	except SyntaxError, e:
+		#said on every hit, where whoever set it is looking
+		(parts, fields, condition) = (['*** SyntaxError: %s'%(e)], [], None)
+	VDBLog.points[number] = [parts[0::2], fields, condition, ignore]
+
+def VDBLogFlush(now=None):
+	import sys
+	import time
+	if len(VDBLog.pending) > 0:
+		sys.__stdout__.write(''.join(VDBLog.pending))
+		sys.__stdout__.flush()
+		del VDBLog.pending[:]
+	VDBLog.flushed = now or time.time()
+
+VDBLog.points = {}
+VDBLog.pending = []
+VDBLog.flushed = 0
+VDBLog.set = VDBLogSet
+VDBLog.flush = VDBLogFlush
+
+import __builtin__
+__builtin__.VDBLog = VDBLog
 """
 
+#autoresponse handlers for the pdb interface, each is called with the session
+#followed by the groups of the pattern that matched, right stripped
+def PDBNext(session, *groups):
+	session.writeline('next')
+
+def PDBReturn(session, *groups):
+	session.writeline('return')
+
+def PDBShowExecution(session, filename, lineno, result=None):
+	session.ui.showexecution(session, filename, int(lineno), result=result)
+
+def PDBFrameCall(session):
+	session.writeline('next')
+
+def PDBBreakpointSet(session, number, *groups):
+	session.breaknum = int(number)
+
+def PDBBreakpointInvalid(session):
+	session.breaknum = None
+
+def PDBUntilFailed(session, location):
+	sys.stderr.write("Can't run to %s, a breakpoint can't be set there\n"%(location))
+
+def PDBFinished(session):
+	session.autokill = True
+
+def PDBSyntaxError(session, message, filename, lineno, text):
+	session.state = ERROR
+	session.ui.showexecution(session, filename, int(lineno), error=message)
+
+def PDBError(session, message):
+	session.state = ERROR
+	sys.stderr.write(message+"\n")
+
+#gdb/MI records are a class followed by comma separated name=value results,
+#where a value is a C string, a {} tuple of results, or a [] list of values
+#or of results
+MIString = re.compile(r'"((?:[^"\\]|\\.)*)"')
+MIName = re.compile(r'([\w-]+)=')
+MIRecord = re.compile(r'^\d*([\^*+=])([\w-]+),?(.*)$')
+
+def MIValue(text, pos):
+	if text[pos] == '"':
+		m = MIString.match(text, pos)
+		return (m.group(1).decode("string_escape"), m.end())
+	if text[pos] == "{":
+		return MIResults(text, pos+1, "}")
+	items = []
+	pos += 1
+	while text[pos] != "]":
+		if text[pos] == ",":
+			pos += 1
+		m = MIName.match(text, pos)
+		if m is not None:
+			pos = m.end()
+		(value, pos) = MIValue(text, pos)
+		items.append(value)
+	return (items, pos+1)
+
+def MIResults(text, pos, end=None):
+	results = {}
+	while pos < len(text) and text[pos] != end:
+		if text[pos] == ",":
+			pos += 1
+		m = MIName.match(text, pos)
+		(results[m.group(1)], pos) = MIValue(text, m.end())
+	return (results, pos+1)
+
+def VDBParseMI(text):
+	"""parses the results of an MI record, the part after its class, into a
+	dict, tuples become dicts and lists become lists, with any names of the
+	items in a list dropped"""
+	try:
+		return MIResults(text, 0)[0]
+	except (AttributeError, IndexError):
+		debuglog("unparsable MI results: %s"%(text))
+		return {}
+
+def VDBQuoteMI(text):
+	"""makes text a single MI argument"""
+	return '"%s"'%(text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+
+#the {expression}s in a logpoint's message
+VDBLogField = re.compile(r"{([^{}]*)}")
+
+def VDBParseMIRecord(line):
+	"""splits an MI result or async record into its kind, class and results,
+	returns None for anything else"""
+	m = MIRecord.match(line)
+	if m is None:
+		return None
+	return (m.group(1), m.group(2), VDBParseMI(m.group(3)))
+
+#autoresponse handlers for the gdb/MI interface
+def MIStopped(session, results):
+	record = VDBParseMI(results)
+	reason = record.get("reason", "")
+	if reason.startswith("exited"):
+		session.autokill = True
+		return
+	frame = record.get("frame", {})
+	if frame.has_key("fullname") and frame.has_key("line"):
+		session.ui.showexecution(session, frame["fullname"], int(frame["line"]))
+	elif reason in ["end-stepping-range", "function-finished"]:
+		#stepped into something without line information, step back out
+		session.writeline(session.interface["returncommand"])
+	else:
+		sys.stderr.write("Stopped in %s (%s)\n"%(frame.get("func", "??"), reason or "no reason given"))
+
+def MIError(session, results):
+	sys.stderr.write(VDBParseMI(results).get("msg", "")+"\n")
+
 interface = [
 	{
 		"interfacename": "pdb",
+		#the TVDBSession class that drives this debugger
+		"session": "TVDBSession",
 		"exec": "/usr/bin/python -i -m pdb %(VDBSourceFile)s %(VDBArgs)s",
 		"autostart": [
-			"exec %r"%(tpipesplit), 
-			"import sys", 
-			"import os",
-			"sys.stdout = TPipeSplit(sys.__stdout__, open('/tmp/vdbo-"+str(os.getpid())+"','w',0))"
+			"exec %r"%(pdbstreams),
+			"exec %r"%(pdbwatches),
+			"exec %r"%(pdblogs),
+			"exec %r"%(pdbtracer),
+			"exec %r"%(pdbcommands),
+			"VDBAddCommands()"
 		],
+		#sends the program's output to the fifo at path, given its args
+		"outputcommand": "VDBSplitStreams(%(path)r)",
+		#only traces what has breakpoints while continuing, see VDBFastTracer
+		"tracecommand": "VDBTraceBreakpoints()",
+		#gets the program going, if it isn't stopped at its start already
+		"startcommand": None,
+		#a reply that says one of the commands above failed
+		"setuperror": "^\s*\*\*\* ",
+		#imports modules ahead of the program, without it seeing them
+		"importcommand": "exec 'import %s' in {}",
 		"prompt": "(Pdb) ",
 		"filetypecheck": "VDBSourceFile.endswith('.py')",
+		#whether the file debugged is the program's source, and so is opened
+		#when the session starts
+		"sourceprogram": True,
+		"stepcommand": "step",
+		"nextcommand": "next",
+		"returncommand": "return",
+		"continuecommand": "continue",
+		#step or next a given number of times, in one go
+		"stepcountcommand": "vdbrepeat %i step",
+		"nextcountcommand": "vdbrepeat %i next",
+		#continues to file:line
+		"untilcommand": "vdbuntil %s",
+		#chains several commands into one line
+		"separator": ";;",
+		#sets a breakpoint at file:line, and the replies that say whether it took
+		"breakcommand": "break %s",
+		"breakresult": "^\s*Breakpoint (\d+) at ",
+		"breakerror": "^\s*(?:\*\*\*|End of file)",
+		"conditioncommand": "condition %i %s",
+		#makes a breakpoint only stop from its nth hit, given n-1
+		"ignorecommand": "ignore %i %i",
+		#turns a breakpoint into a logpoint, given its number, message, condition
+		#and the hits to skip before it starts logging. The message and condition
+		#come base64 encoded, pdb would split them at any ;; in them
+		"logcommands": ["!VDBLog.set(%(number)i, %(log)r, %(condition)r, %(ignore)i)", "condition %(number)i VDBLog(%(number)i)"],
+		#a line a logpoint wrote, which goes to the log window
+		"logresult": "^VDBLog (.*)",
+		"clearcommand": "clear %i",
+		#evaluates every watch in the current frame in one go, %s is the reprs of
+		#the list of (watch, page) pairs and the (chars, items, depth) limits
+		#when they have changed, otherwise empty. Watches go base64 encoded, like
+		#logpoint messages, pdb would split them at any ;; in them
+		"watchcommand": "!VDBEvalWatches(%s)",
+		"watchresult": "^VDBWatch (\d+) (ok|error) (.*)",
+		#lists expressions for the elements/attributes of a watch, given base64
+		#encoded
+		"childrencommand": "!VDBWatchChildren(%r, %i)",
+		"childresult": "^VDBChild (.*)",
+		#prints the call stack, a frame line per frame, each maybe followed by
+		#its source line, frames up to the last one in stackbottom are the
+		#debugger's own
+		"stackcommand": "where",
+		"stackframe": "^[ >] (.*)\((\d+)\)[^()]*\(\)",
+		"stacksource": "^-> (.*)",
+		"stackbottom": "<string>",
+		"autoresponse": [
+			("\(Pdb\) .*", None),
+			("^\s*> <string>\(1\)\?\(\)->None", None),
+			("^\s*-> .*", None),
+			("^\s*> <string>\((\d+)\).*", PDBNext),
+			("^\s*> (.*)\((\d+)\).*\(\)", PDBShowExecution),
+			("^\s*> (.*)\((\d+)\).*\(\)->\((.*)\)", PDBShowExecution),
+			("^\s*--Return--", None),
+			("^\s*--Call--", PDBFrameCall),
+			("^\s*> <string>.*", PDBReturn),
+			("^\s*Breakpoint (\d+) at (.*):(\d+)", PDBBreakpointSet),
+			("^\s*\*\*\* There are no breakpoints in .*", None),
+			("^\s*\*\*\* There is no breakpoint at .*:\d+", None),
+			("^\s*\*\*\* Can't run to (.*)", PDBUntilFailed),
+			("^\s*End of file", PDBBreakpointInvalid),
+			("^\s*\*\*\* Blank or comment", PDBBreakpointInvalid),
+			("^\s*Breakpoint (\d+) is now unconditional.", PDBBreakpointSet),
+			("^\s*The program finished and will be restarted", PDBFinished),
+			("^\s*SyntaxError: \('(.*)', \('(.*)', (\d+), \d+, '(.*)'\)\)", PDBSyntaxError),
+			("^\s*(?:\*\*\*)* ?(.*Error:.*)", PDBError)
+		]
+	},
+	#experimental, only ever run against bench/fakegdb.py so far
+	{
+		"interfacename": "gdb",
+		"session": "TMISession",
+		"exec": "gdb -q -nx --interpreter=mi2 %(VDBSourceFile)s",
+		"autostart": [
+			"-gdb-set confirm off",
+			"-gdb-set width 0",
+			"-gdb-set height 0"
+		],
+		#the shell gdb starts the program with does the redirection
+		"outputcommand": "-exec-arguments %(args)s > %(path)s",
+		"tracecommand": None,
+		"startcommand": "-exec-run --start",
+		"setuperror": "^\d*\^error",
+		"importcommand": None,
+		#MI prompts on a line of its own, after every command, including the
+		#ones that set the program running
+		"prompt": "(gdb)",
+		"promptline": True,
+		"runningresult": "^\d*\^running",
+		"stoppedresult": "^\d*\*stopped",
+		"filetypecheck": "not VDBSourceFile.endswith('.py') and os.access(VDBSourceFile, os.X_OK)",
+		"sourceprogram": False,
+		"stepcommand": "-exec-step",
+		"nextcommand": "-exec-next",
+		"returncommand": "-exec-finish",
+		"continuecommand": "-exec-continue",
+		"stepcountcommand": "-exec-step %i",
+		"nextcountcommand": "-exec-next %i",
+		#also stops if the current function returns first
+		"untilcommand": "-exec-until %s",
+		#MI has no way of putting several commands on a line, but they can be
+		#sent in one go
+		"separator": "\n",
+		"breakcommand": '-break-insert "%s"',
+		"breakresult": '^\d*\^done,bkpt=\{number="(\d+)"',
+		"breakerror": "^\d*\^error",
+		"conditioncommand": "-break-condition %i %s",
+		"ignorecommand": "-break-after %i %i",
+		#logpoints are dprintfs, see TMISession.configure, and their lines come
+		#as console records
+		"logcommands": None,
+		"logresult": r'^~"VDBLog (.*)\\n"$',
+		"clearcommand": "-break-delete %i",
+		#watches are floating variable objects, reevaluated in whichever frame
+		#is current, this reports the ones that changed
+		"watchcommand": "-var-update --all-values *",
+		"watchresult": "^\d*\^done,changelist=",
+		"childrencommand": "-var-list-children %s",
+		"childresult": "^\d*\^done,",
+		"stackcommand": "-stack-list-frames",
+		"stackframe": "^\d*\^done,stack=",
+		"stacksource": "^$",
+		"stackbottom": None,
 		"autoresponse": [
-			("\(Pdb\) .*", ""),
-			("^\s*> <string>\(1\)\?\(\)->None", ""),
-			("^\s*-> .*", ""),
-			("^\s*> <string>\((\d+)\).*", "self.writeline('next')"),
-			("^\s*> (.*)\((\d+)\).*\(\)", "VDBShowExecution('%1', %2)"),
-			("^\s*> (.*)\((\d+)\).*\(\)->\((.*)\)", "VDBShowExecution('%1', %2, result=%3)"),
-			("^\s*--Return--", "if len(VDBStack) > 0: VDBStack.pop()"),
-			("^\s*--Call--", "self.framecapture = True; self.writeline('next')"),
-			("^\s*> <string>.*", "self.writeline('return')"),
-			("^\s*Breakpoint (\d+) at (.*):(\d+)", "self.breaknum = %1"),
-			("^\s*\*\*\* There are no breakpoints in .*", ""),
-			("^\s*\*\*\* There is no breakpoint at .*:\d+", ""),
-			("^\s*End of file", "self.breaknum = None"),
-			("^\s*\*\*\* Blank or comment", "self.breaknum = None"),
-			("^\s*Breakpoint (\d+) is now unconditional.", "self.breaknum = %1"),
-			("^\s*The program finished and will be restarted", "self.autokill = True"),
-			("^\s*SyntaxError: \('(.*)', \('(.*)', (\d+), \d+, '(.*)'\)\)", "self.state = ERROR; VDBShowExecution('%2', %3, error='%1')"),
-			("^\s*(?:\*\*\*)* ?(.*Error:.*)", "self.state = ERROR; sys.stderr.write('%1\\n')")
+			("^\(gdb\)", None),
+			("^\d*\*stopped(.*)", MIStopped),
+			("^\d*\^error(.*)", MIError)
 		]
 	}
 ]
 
 VDBSession = None
-VDBWatchWindow = None
-VDBWatchBuffer = None
-VDBOutputWindow = None
-VDBOutputBuffer = None
-VDBStackWindow = None
-VDBConsoleWindow = None
-VDBSourceWindow = None
+VDBStandbySession = None
 VDBExecFilename = None
 VDBSourceFile = None
 VDBRuntimeArgStr = None
-VDBBreakpoint = {}
 VDBWatches = []
-VDBStack = []
+VDBWatchValues = {}
+VDBWatchPages = {}
+VDBWatchSigns = []
+#the call stack at the current stop, None until it is fetched
+VDBStack = None
 VDBErrorSign = None
+VDBExecSign = 65535
+VDBExecLine = None
+VDBPollTimer = None
+#the buffer each source file the program has been seen in is loaded in, by the
+#file's real path, as debuggers don't always name a file the way Vim does
+VDBBufferNumbers = {}
+
+#the globals above that belong to the current session, each other session
+#keeps its own values of these in its TSessionState until it's switched to.
+#Its windows and buffers are kept on the TSessionState itself all the time
+VDBSessionGlobals = ["VDBSession", "VDBExecFilename", "VDBSourceFile", "VDBRuntimeArgStr", "VDBWatches", "VDBWatchValues", "VDBWatchPages", "VDBWatchSigns", "VDBStack", "VDBErrorSign", "VDBExecSign", "VDBExecLine"]
+
+class TSessionState(object):
+	"""one debug session's windows and buffers, and its share of the module
+	globals, held here while another session is the current one"""
+	def __init__(self, number):
+		self.number = number
+		self.announced = False
+		self.watchwindow = None
+		self.watchbuffer = None
+		self.outputwindow = None
+		self.outputbuffer = None
+		self.logwindow = None
+		self.logbuffer = None
+		self.stackwindow = None
+		self.consolewindow = None
+		#the transcript line the console buffer's first line is
+		self.consoleshown = None
+		self.sourcewindow = None
+		self.values = {}
+		for name in VDBSessionGlobals:
+			self.values[name] = None
+		self.values.update({"VDBWatches": [], "VDBWatchValues": {}, "VDBWatchPages": {}, "VDBWatchSigns": [], "VDBExecSign": 65536-number})
+
+	def save(self):
+		for name in VDBSessionGlobals:
+			self.values[name] = globals()[name]
+
+	def restore(self):
+		globals().update(self.values)
+
+	def get(self, name):
+		if self is VDBCurrentState:
+			return globals()[name]
+		return self.values[name]
+
+	def session(self):
+		return self.get("VDBSession")
+
+VDBCurrentState = TSessionState(1)
+VDBSessionStates = [VDBCurrentState]
+
+def VDBSessionState(number):
+	"""the state of the session with the given number, None if it's gone"""
+	for state in VDBSessionStates:
+		if state.number == number:
+			return state
+	return None
+
+def VDBBufferName(name):
+	"""the name of one of the current session's windows, numbered past the
+	first session so every session's buffers are its own"""
+	if VDBCurrentState.number == 1:
+		return "[%s]"%(name)
+	return "[%s %i]"%(name, VDBCurrentState.number)
+
+#watch window signs are numbered from here, by line
+WATCHSIGN = 60000
 
 READY = 0
 ERROR = -1
 CONSOLE = 1
 INPUT = 2
+RUNNING = 3
 
 def VDBSetDebugFile():
+	global VDB_DEBUG
+	global VDBDebugFile
+
 	name = VDBGetInput("Enter name of debug log file: ")
-	if name is not None:
-		debug = open(name,"w")
-		debug.close()
+	if name:
+		if VDBDebugFile is not None:
+			VDBDebugFile.close()
+		VDBDebugFile = open(name,"w")
 		VDB_DEBUG = True
 
 def debuglog(str, suppress = False):
 	if VDB_DEBUG:
-		debug = open("debug.out","a")
 		if suppress:
-			debug.write(str)
+			VDBDebugFile.write(str)
 		else:
-			debug.write(str+"\n")
-		debug.close()
+			VDBDebugFile.write(str+"\n")
+
+class TTrace(object):
+	"""times each user command, split into the phases it spent its time in.
+	Phases nest, time is charged to the innermost one, so waiting on the
+	debugger from inside an autoresponse counts as waiting, not parsing. Only
+	the thread timing the command counts, not a standby starting up. A
+	command that leaves the program running in the background is suspended,
+	and finished once the program stops, with the time in between counted as
+	waiting"""
+	def __init__(self, keep=1000):
+		self.keep = keep
+		self.samples = {}
+		self.command = None
+		self.thread = None
+		self.stack = []
+		self.file = None
+		#the commands waiting for their program to stop, by session
+		self.suspended = {}
+
+	def begin(self, command):
+		"""starts timing command, returns False if another command is already
+		being timed, in which case this one is just part of it"""
+		if self.command is not None:
+			return False
+		self.command = command
+		self.thread = threading.currentThread()
+		self.phases = {}
+		self.started = self.mark = time.time()
+		self.stack = ["other"]
+		return True
 
-class TVDBSession(object):
-	def __init__(self, interface, VDBSourceFile, VDBArgs):
-		self.interface = interface
-		self.debugqueue = []
-		self.console = ['']
-		self.autokill = False
-		self.state = READY
-		self.unmodifiablebuffers = []
-		self.framecapture = False
-		
-		if (not os.path.exists("/tmp/vdbo-"+str(os.getpid()))):
-			os.mkfifo("/tmp/vdbo-"+str(os.getpid()),0644)
+	def enter(self, phase):
+		if self.command is not None and threading.currentThread() is self.thread:
+			now = time.time()
+			self.phases[self.stack[-1]] = self.phases.get(self.stack[-1], 0.0)+now-self.mark
+			self.stack.append(phase)
+			self.mark = now
+
+	def leave(self):
+		if self.command is not None and threading.currentThread() is self.thread:
+			now = time.time()
+			phase = self.stack.pop()
+			self.phases[phase] = self.phases.get(phase, 0.0)+now-self.mark
+			self.mark = now
+
+	def suspend(self, key):
+		"""puts the command being timed aside, unfinished, until resume(key)"""
+		if self.command is None:
+			return
+		now = time.time()
+		self.phases[self.stack[-1]] = self.phases.get(self.stack[-1], 0.0)+now-self.mark
+		self.suspended[key] = (self.command, self.phases, self.started, now)
+		self.command = None
+		self.stack = []
+
+	def resume(self, key):
+		"""carries on timing the command suspended under key, if there is one
+		and nothing else is being timed, returns whether it did"""
+		if self.command is not None or not self.suspended.has_key(key):
+			return False
+		(self.command, self.phases, self.started, suspended) = self.suspended.pop(key)
+		self.thread = threading.currentThread()
+		self.mark = time.time()
+		self.phases["wait"] = self.phases.get("wait", 0.0)+self.mark-suspended
+		self.stack = ["other"]
+		return True
+
+	def drop(self, key):
+		self.suspended.pop(key, None)
+
+	def end(self):
+		if self.command is None:
+			#suspended, it's finished when the program stops
+			return
+		now = time.time()
+		self.phases[self.stack[-1]] = self.phases.get(self.stack[-1], 0.0)+now-self.mark
+		self.phases["total"] = now-self.started
+		for (phase, seconds) in self.phases.items():
+			key = (self.command, phase)
+			if not self.samples.has_key(key):
+				self.samples[key] = collections.deque(maxlen=self.keep)
+			self.samples[key].append(seconds)
+		if VDBTraceFile is not None:
+			if self.file is None or self.file.name != VDBTraceFile:
+				self.file = open(VDBTraceFile, "a")
+			self.file.write(json.dumps({"time": self.started, "command": self.command, "phases": self.phases})+"\n")
+		self.command = None
+		self.stack = []
+
+	def flush(self):
+		if self.file is not None:
+			self.file.flush()
+		if VDBDebugFile is not None:
+			VDBDebugFile.flush()
+
+	def percentile(self, samples, fraction):
+		ordered = sorted(samples)
+		return ordered[int(round(fraction*(len(ordered)-1)))]
+
+	def summary(self):
+		"""returns report lines with the median and 95th percentile time (ms) of
+		each phase of each command"""
+		lines = ["%-10s %-8s %6s %9s %9s"%("command", "phase", "count", "p50 ms", "p95 ms")]
+		for (command, phase) in sorted(self.samples):
+			samples = self.samples[(command, phase)]
+			lines.append("%-10s %-8s %6i %9.2f %9.2f"%(command, phase, len(samples), self.percentile(samples, 0.5)*1000, self.percentile(samples, 0.95)*1000))
+		return lines
+
+VDBTrace = TTrace()
+
+def VDBTraced(command, resumes=False):
+	"""times every call of the decorated function as a user command, or if it
+	resumes, as the end of the command that left the current session's program
+	running in the background, if there is one"""
+	def decorate(function):
+		def traced(*args, **kwargs):
+			if not (resumes and VDBTrace.resume(VDBSession)) and not VDBTrace.begin(command):
+				return function(*args, **kwargs)
+			try:
+				return function(*args, **kwargs)
+			finally:
+				VDBTrace.end()
+				VDBTrace.flush()
+		return traced
+	return decorate
+
+def VDBPhase(phase):
+	"""charges the time spent in the decorated function to phase"""
+	def decorate(function):
+		def timed(*args, **kwargs):
+			VDBTrace.enter(phase)
+			try:
+				return function(*args, **kwargs)
+			finally:
+				VDBTrace.leave()
+		return timed
+	return decorate
+
+def VDBStats():
+	for line in VDBTrace.summary():
+		print line
+
+class TAutoresponse(object):
+	"""an interface's autoresponse table, compiled once, patterns are indexed
+	by the first character of their literal prefix, so a line is only tried
+	against the patterns that could possibly match it, in table order"""
+	def __init__(self, table):
+		self.index = {}
+		wildcard = []
+		keyed = []
+		for (order, (pattern, handler)) in enumerate(table):
+			entry = (order, re.compile(pattern), handler)
+			key = self.leadingchar(pattern)
+			if key is None:
+				wildcard.append(entry)
+			else:
+				keyed.append((key, entry))
+		self.wildcard = [(regex, handler) for (order, regex, handler) in wildcard]
+		for (key, entry) in keyed:
+			self.index.setdefault(key, list(wildcard)).append(entry)
+		for key in self.index:
+			self.index[key].sort()
+			self.index[key] = [(regex, handler) for (order, regex, handler) in self.index[key]]
+
+	def leadingchar(self, pattern):
+		#the first literal character a line must start with (ignoring leading
+		#whitespace) to match pattern, or None if the pattern can start with
+		#anything
+		if pattern.startswith("^"):
+			pattern = pattern[1:]
+		if pattern.startswith("\\s*"):
+			pattern = pattern[3:]
+		if pattern == "":
+			return None
+		if pattern[0] == "\\":
+			if len(pattern) > 1 and not pattern[1].isalnum() and pattern[2:3] not in ["*", "?", "{"]:
+				return pattern[1]
+			return None
+		if pattern[0] in ".^$*+?{}[]|()" or pattern[0].isspace():
+			return None
+		if len(pattern) > 1 and pattern[1] in "*?{":
+			return None
+		return pattern[0]
+
+	def match(self, line):
+		"""returns (handler, groups) for the first pattern matching line, or None"""
+		for (regex, handler) in self.index.get(line.lstrip()[:1], self.wildcard):
+			m = regex.match(line)
+			if m is not None:
+				return (handler, [g and g.rstrip() for g in m.groups()])
+		return None
+
+VDBAutoresponse = {}
+
+def VDBGetAutoresponse(interface):
+	if not VDBAutoresponse.has_key(interface["interfacename"]):
+		VDBAutoresponse[interface["interfacename"]] = TAutoresponse(interface["autoresponse"])
+	return VDBAutoresponse[interface["interfacename"]]
+
+class TTranscript(object):
+	"""the debugger console transcript, the last line is the one still being
+	written to. Lines are numbered from the start of the session, so a buffer
+	showing the transcript can be brought up to date with only the lines it
+	hasn't seen, even after old ones have been dropped. The reader thread
+	adds to it while the program runs in the background, so it's only ever
+	looked at or changed with its lock held"""
+	def __init__(self, maxlines, spill=None):
+		self.lock = threading.Lock()
+		self.lines = collections.deque([''])
+		self.dropped = 0
+		self.maxlines = maxlines
+		self.spill = None
+		if spill is not None:
+			self.spill = open(spill, "a")
+
+	def __len__(self):
+		with self.lock:
+			return self.dropped+len(self.lines)
+
+	def add(self, str):
+		with self.lock:
+			self.lines[-1] += str
+
+	def _newline(self):
+		self.lines.append('')
+		while len(self.lines) > self.maxlines:
+			line = self.lines.popleft()
+			self.dropped += 1
+			if self.spill is not None:
+				self.spill.write(line+"\n")
+
+	def newline(self):
+		with self.lock:
+			self._newline()
+
+	def addline(self, str):
+		"""finishes the line with str, without the other thread getting a
+		word in between"""
+		with self.lock:
+			self.lines[-1] += str
+			self._newline()
+
+	def since(self, number):
+		"""returns how many lines have been dropped, and the lines from line
+		number onwards, as far as they are kept"""
+		with self.lock:
+			start = max(number-self.dropped, 0)
+			return (self.dropped, [self.lines[i] for i in range(start, len(self.lines))])
+
+	def close(self):
+		with self.lock:
+			if self.spill is not None:
+				self.spill.close()
+				self.spill = None
+
+class TSessionUI(object):
+	"""what a session tells its user interface about, these do nothing, so a
+	session can also be driven without Vim"""
+	def showoutput(self, session, output):
+		pass
+
+	def showlogs(self, session, lines):
+		pass
+
+	def inputwanted(self, session):
+		"""the debugger didn't come back with a prompt, so the program is
+		presumably waiting for input"""
+		pass
+
+	def showexecution(self, session, filename, lineno, result=None, error=None):
+		pass
+
+VDBSessionCount = itertools.count(1)
+
+def VDBCloseOnExec(fd):
+	fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+
+class TPtyTransport(object):
+	"""runs the debugger here on a pty, the program's output comes back
+	separately through a fifo"""
+	def __init__(self, argv):
+		#each session has a fifo of its own, as a standby can be starting
+		#while another session is still using its fifo
+		self.outputpath = "/tmp/vdbo-%i-%i"%(os.getpid(), VDBSessionCount.next())
+		if (not os.path.exists(self.outputpath)):
+			os.mkfifo(self.outputpath,0644)
+		#open the read end first and without blocking, so the debugger's open of
+		#the write end during autostart never stalls, the spare write end keeps
+		#the fifo from reporting end of file while nobody else has it open
+		self.outputfd = os.open(self.outputpath, os.O_RDONLY | os.O_NONBLOCK)
+		self.outputkeepalive = os.open(self.outputpath, os.O_WRONLY)
+		#the debuggers, this one and any started later, mustn't hold the fifo
+		#or pty of a session open
+		for fd in [self.outputfd, self.outputkeepalive]:
+			VDBCloseOnExec(fd)
 
 		(pid, master) = pty.fork()
 		if pid == 0:
@@ -118,168 +1136,555 @@ class TVDBSession(object):
 			attrs[3] = attrs[3] & ~tty.ECHO
 			attrs[0] = attrs[0] & tty.IGNBRK
 			tty.tcsetattr(1, tty.TCSANOW, attrs)
-			argv = shlex.split(self.interface["exec"] % {"VDBSourceFile": VDBSourceFile, "VDBArgs": VDBArgs})
 			os.execv(argv[0], argv) 
 
+		self.pid = pid
+		self.master = master
+		VDBCloseOnExec(master)
 		self.sendpipe = os.fdopen(master, "w", 0)
 		self.receivepipe = os.fdopen(master, "r", 0)
 		flags = fcntl.fcntl(self.receivepipe.fileno(), fcntl.F_GETFL, 0)
 		flags = flags | os.O_NONBLOCK
 		fcntl.fcntl(self.receivepipe.fileno(), fcntl.F_SETFL, flags)
 
+	def read(self):
+		"""what the debugger has written, None if there's nothing yet, "" once
+		it has gone away"""
+		try:
+			return os.read(self.master, VDBReadChunk)
+		except OSError, e:
+			if e.errno == errno.EIO:
+				return ""
+			return None
+
+	def readoutput(self, output):
+		"""appends whatever the program has written to output"""
+		try:
+			data = os.read(self.outputfd, VDBReadChunk)
+			while data != "":
+				output.append(data)
+				data = os.read(self.outputfd, VDBReadChunk)
+		except OSError:
+			pass
+
+	def wait(self, deadline, output):
+		"""blocks until the debugger has written something, draining the
+		process output fifo into output in the meantime so the debugged process
+		can never stall on a full pipe, returns False if the deadline passes
+		first"""
+		fds = [self.master, self.outputfd]
+		while True:
+			timeout = deadline - time.time()
+			if timeout <= 0:
+				return False
+			try:
+				(readable, writable, failed) = select.select(fds, [], [], timeout)
+			except select.error:
+				continue
+			if self.outputfd in readable:
+				self.readoutput(output)
+			if self.master in readable:
+				return True
+
+	def write(self, data):
+		self.sendpipe.write(data)
+
+	def interrupt(self):
+		os.kill(self.pid, signal.SIGINT)
+
+	def close(self):
+		try:
+			os.close(self.outputfd)
+			os.close(self.outputkeepalive)
+			os.remove(self.outputpath)
+			self.receivepipe.close()
+			self.sendpipe.close()
+		except (IOError, OSError):
+			pass
+
+#messages to and from vdbagent.py are a kind character, a flags byte (1 if the
+#data is zlib compressed) and the length of the data, followed by the data
+VDBFrameHeader = struct.Struct("!cBI")
+
+def VDBFrame(kind, data):
+	flags = 0
+	if len(data) >= VDBCompressMin:
+		packed = zlib.compress(data, 1)
+		if len(packed) < len(data):
+			(data, flags) = (packed, 1)
+	return VDBFrameHeader.pack(kind, flags, len(data))+data
+
+class TFrames(object):
+	"""cuts the stream of data from a socket up into (kind, data) frames"""
+	def __init__(self):
+		self.buffer = bytearray()
+
+	def feed(self, data):
+		self.buffer += data
+		frames = []
+		while len(self.buffer) >= VDBFrameHeader.size:
+			(kind, flags, length) = VDBFrameHeader.unpack(str(self.buffer[:VDBFrameHeader.size]))
+			if len(self.buffer) < VDBFrameHeader.size+length:
+				break
+			data = str(self.buffer[VDBFrameHeader.size:VDBFrameHeader.size+length])
+			del self.buffer[:VDBFrameHeader.size+length]
+			if flags & 1:
+				data = zlib.decompress(data)
+			frames.append((kind, data))
+		return frames
+
+class TSocketTransport(object):
+	"""talks to a vdbagent.py, which runs the debugger and splits off the
+	program's output where the program is. The agent holds back what the
+	debugger writes until it prompts, and sends any program output in the
+	same write, so over a slow link each command costs one round trip"""
+	def __init__(self, address, argv, prompt):
+		if ":" in address:
+			(host, port) = address.rsplit(":", 1)
+			self.socket = socket.create_connection((host, int(port)))
+			self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		else:
+			self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			self.socket.connect(address)
+		VDBCloseOnExec(self.socket.fileno())
+		self.frames = TFrames()
+		self.data = []
+		self.output = []
+		self.eof = False
+		self.started = None
+		self.socket.sendall(VDBFrame("S", json.dumps({"argv": argv, "prompt": prompt})))
+		deadline = time.time()+VDBTimeout
+		while self.started is None and not self.eof and time.time() < deadline:
+			select.select([self.socket], [], [], max(deadline-time.time(), 0))
+			self._receive()
+		if self.started is None:
+			raise IOError("vdbagent at %s didn't start the debugger"%(address))
+		self.outputpath = self.started["outputpath"].encode("utf-8")
+
+	def _receive(self):
+		"""takes in whatever has arrived, returns False if there was nothing"""
+		try:
+			data = self.socket.recv(VDBReadChunk, socket.MSG_DONTWAIT)
+		except socket.error, e:
+			if e.errno in [errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR]:
+				return False
+			data = ""
+		if data == "":
+			self.eof = True
+			return False
+		for (kind, data) in self.frames.feed(data):
+			if kind == "D":
+				self.data.append(data)
+			elif kind == "O":
+				self.output.append(data)
+			elif kind == "P":
+				self.started = json.loads(data)
+		return True
+
+	def read(self):
+		while self._receive():
+			pass
+		if len(self.data) > 0:
+			data = "".join(self.data)
+			del self.data[:]
+			return data
+		if self.eof:
+			return ""
+		return None
+
+	def readoutput(self, output):
+		while self._receive():
+			pass
+		output.extend(self.output)
+		del self.output[:]
+
+	def wait(self, deadline, output):
+		while len(self.data) == 0 and not self.eof:
+			timeout = deadline - time.time()
+			if timeout <= 0:
+				return False
+			try:
+				select.select([self.socket], [], [], timeout)
+			except select.error:
+				continue
+			while self._receive():
+				pass
+			output.extend(self.output)
+			del self.output[:]
+		return True
+
+	def write(self, data):
+		self.socket.sendall(VDBFrame("W", data))
+
+	def interrupt(self):
+		self.socket.sendall(VDBFrame("I", ""))
+
+	def close(self):
+		try:
+			self.socket.sendall(VDBFrame("C", ""))
+		except socket.error:
+			pass
+		self.socket.close()
+
+class TVDBSession(object):
+	def __init__(self, interface, VDBSourceFile, VDBArgs, ui=None, background=False):
+		self.interface = interface
+		if ui is None:
+			ui = TSessionUI()
+		self.ui = ui
+		self.autoresponse = VDBGetAutoresponse(interface)
+		self.debugqueue = collections.deque()
+		self.console = TTranscript(VDBConsoleMaxLines, VDBConsoleSpill)
+		self.autokill = False
+		self.state = READY
+		self.unmodifiablebuffers = []
+		self.watchlist = []
+		self.watchlimits = None
+		self.watchresult = re.compile(interface["watchresult"])
+		self.childresult = re.compile(interface["childresult"])
+		self.stackframe = re.compile(interface["stackframe"])
+		self.stacksource = re.compile(interface["stacksource"])
+		self.breakresult = re.compile(interface["breakresult"])
+		self.breakerror = re.compile(interface["breakerror"])
+		self.logresult = re.compile(interface["logresult"])
+		
+		self.output = collections.deque()
+		#lines logpoints wrote, kept apart from the debug queue so they can be
+		#shown while the program runs
+		self.logs = collections.deque()
+		argv = shlex.split(self.interface["exec"] % {"VDBSourceFile": VDBSourceFile, "VDBArgs": VDBArgs})
+		if VDBRemote is None:
+			self.transport = TPtyTransport(argv)
+		else:
+			self.transport = TSocketTransport(VDBRemote, argv, self.interface["prompt"])
+
+		#raw pty data, lines are sliced out from readstart, and the consumed
+		#prefix is only dropped when more data is pulled in, readscan is where
+		#the search for the next line ending resumes so nothing is rescanned
+		self.readbuffer = bytearray()
+		self.readstart = 0
+		self.readscan = 0
 		self.buffer = ""
 		self.bufferwritepos = 0
+		self.eof = False
 		self.readlines()
-	
-		for asc in self.interface["autostart"]:
-			self.writeline(asc)
+		commands = self.interface["autostart"]+[self.interface["outputcommand"]%{"path": self.transport.outputpath, "args": VDBArgs}]
+		if VDBFastTracer and self.interface["tracecommand"] is not None:
+			commands.append(self.interface["tracecommand"])
+		#a failure here would otherwise only show later as a feature not
+		#working, they're kept for whoever shows the session to report
+		setuperror = re.compile(self.interface["setuperror"])
+		self.setuperrors = [response.strip() for response in self.batch(commands) if setuperror.match(response)]
+		if self.interface["startcommand"] is not None:
+			#what it says when the program stops is left queued, like the
+			#initial stop of a debugger that starts out stopped
+			self.writeline(self.interface["startcommand"])
 			self.readlines()
 
-		self.outputpipe = open("/tmp/vdbo-"+str(os.getpid()),"r",0)
-		flags = fcntl.fcntl(self.outputpipe.fileno(), fcntl.F_GETFL, 0)
-		flags = flags | os.O_NONBLOCK
-		fcntl.fcntl(self.outputpipe.fileno(), fcntl.F_SETFL, flags)
+		#the reader thread only touches the pty and fifo between resume() and
+		#it setting stopped, the rest of the time they belong to the main thread
+		self.background = background
+		self.closing = False
+		self.resumed = threading.Event()
+		self.stopped = threading.Event()
+		#the debugger's number for each of the shared breakpoints it has set
+		self.breaknumbers = {}
+		if self.background:
+			self.reader = threading.Thread(target=self._run)
+			self.reader.setDaemon(True)
+			self.reader.start()
 
 	def __del__(self):
+		self.close()
+
+	def close(self):
+		if self.closing:
+			return
+		self.closing = True
+		self.resumed.set()
 		try:
-			self.outputpipe.close()
-			os.remove("/tmp/vdbo-"+str(os.getpid()))
-			self.receivepipe.close()
-			self.sendpipe.close()
-		except IOError:
+			self.console.close()
+		except (IOError, OSError):
 			pass
+		self.transport.close()
+
+	def _run(self):
+		while True:
+			self.resumed.wait()
+			if self.closing:
+				return
+			try:
+				while not self.closing and not self.eof:
+					line = self.readline(time.time()+0.25)
+					if line is not None:
+						self._queue(line)
+					elif self.atprompt():
+						break
+			except (IOError, OSError, select.error, ValueError):
+				pass
+			self.resumed.clear()
+			self.stopped.set()
+
+	def resume(self, command):
+		"""sends a command that sets the program running, and hands the pty over
+		to the reader thread until the debugger prompts again"""
+		self.writeline(command)
+		self.state = RUNNING
+		self.stopped.clear()
+		self.resumed.set()
+
+	def interrupt(self):
+		self.transport.interrupt()
 	
+	def _fill(self):
+		data = self.transport.read()
+		if data is None:
+			return False
+		if data == "":
+			self.eof = True
+			return False
+		if self.readstart > 0:
+			del self.readbuffer[:self.readstart]
+			self.readscan -= self.readstart
+			self.readstart = 0
+		self.readbuffer += data
+		return True
+
 	def _readline(self):
-		try:
-			char = self.receivepipe.read(1)
-			while char != "\r":
-				self.buffer += char
-				char = self.receivepipe.read(1)
-			self.receivepipe.read(1)
-			line = self.buffer
-			self.buffer = ""
-			debuglog(line)
-			self.console[len(self.console)-1] += line
-			self.console.append('')
-			return line
-		except IOError:
-			debuglog(self.buffer[self.bufferwritepos:],True)
-			self.console[len(self.console)-1] += self.buffer[self.bufferwritepos:]
-			if self.bufferwritepos < len(self.buffer):
-				self.bufferwritepos += len(self.buffer)
-			return None
+		pos = self.readbuffer.find("\r\n", self.readscan)
+		while pos == -1:
+			#a trailing \r may be the first half of a line ending still in transit
+			self.readscan = max(self.readstart, len(self.readbuffer)-1)
+			if not self._fill():
+				self.buffer = str(self.readbuffer[self.readstart:])
+				debuglog(self.buffer[self.bufferwritepos:],True)
+				self.console.add(self.buffer[self.bufferwritepos:])
+				self.bufferwritepos = len(self.buffer)
+				return None
+			pos = self.readbuffer.find("\r\n", self.readscan)
+		line = str(self.readbuffer[self.readstart:pos])
+		self.readstart = self.readscan = pos+2
+		self.buffer = ""
+		debuglog(line[self.bufferwritepos:])
+		self.console.addline(line[self.bufferwritepos:])
+		self.bufferwritepos = 0
+		return line
 	
-	def readline(self):
+	def atprompt(self):
+		#only the unterminated tail can hold the prompt, and terminals may put
+		#control sequences in front of it
+		return self.buffer.endswith(self.interface["prompt"])
+
+	def _wait(self, deadline):
+		return self.transport.wait(deadline, self.output)
+
+	def readline(self, deadline=None):
 		line = self._readline()
-		if line is None:
-			time.sleep(0.1)
+		while line is None and deadline is not None and not self.eof and not self.atprompt():
+			if not self._wait(deadline):
+				break
 			line = self._readline()
 		return line
 	
-	def readlines(self):
-		global VDBOutputWindow
-		global VDBOutputBuffer
+	def _queue(self, line):
+		m = self.logresult.match(line)
+		if m is None:
+			self.debugqueue.append(line)
+		else:
+			self.logs.append(self.logline(m.group(1)))
 
+	def logline(self, text):
+		"""the line to show for what a logpoint wrote"""
+		return text
+
+	@VDBPhase("wait")
+	def readlines(self):
 		ret = False
-		line = self.readline()
+		deadline = time.time() + VDBTimeout
+		line = self.readline(deadline)
 		while line is not None:
-			self.debugqueue.append(line)
-			line = self.readline()
+			self._queue(line)
+			line = self.readline(deadline)
 			ret = True
-		if not self.buffer.startswith(self.interface["prompt"]):
+		if not self.atprompt():
 			self.state = INPUT
-			if VDBOutputWindow is None and VDBOutputBuffer is not None:
-				vim.command("silent %inew %s"%(vim.current.window.height/2, "[Process Output]"))
-				vim.command("setlocal buftype=nofile nowrap noautoindent nobuflisted tw=0 nomodifiable")
-				vim.command("autocmd InsertLeave <buffer> setlocal nomodifiable")
-				VDBOutputWindow = vim.current.window
-				VDBOutputBuffer = vim.current.buffer
-				vim.command("nmap <silent> <buffer> i :python VDBInputInsert()<CR>")
-				vim.command("imap <silent> <buffer> <Bs> <C-\><C-O>:python VDBConsoleKeystroke(0)<CR>")
-				vim.command("imap <silent> <buffer> <Left> <C-\><C-O>:python VDBConsoleKeystroke(1)<CR>")
-				vim.command("imap <silent> <buffer> <C-Left> <C-\><C-O>:python VDBConsoleKeystroke(1)<CR>")
-				vim.command("imap <silent> <buffer> <S-Left> <C-\><C-O>:python VDBConsoleKeystroke(1)<CR>")
-				vim.command("imap <silent> <buffer> <Home> <C-\><C-O>:python VDBConsoleKeystroke(2)<CR>")
-				vim.command("imap <silent> <buffer> <kHome> <C-\><C-O>:python VDBConsoleKeystroke(2)<CR>")
-				vim.command("inoremap <buffer> <CR> <C-\><C-O>:python VDBConsoleKeystroke(-1)<CR>")
-				for k in ["<Up>", "<Down>", "<S-Up>", "<S-Down>", "<S-Left>", "<S-Right>", "<C-Left>", "<C-Right>", "<C-Up>", "<C-Down>", "<PageUp>", "<PageDown>", "<kPageUp>", "<kPageDown>", "<kEnter>", "<C-w>"]:
-					vim.command("imap <silent> <buffer> %s <C-\><C-O>:python VDBConsoleKeystroke(-2)<CR>"%(k))
-				vim.command("autocmd BufLeave <buffer> python VDBOutputWindow = VDBWindowDeleted(VDBOutputWindow)")
-				vim.command("autocmd BufDelete <buffer> python VDBOutputBuffer = VDBOutputWindow = None")
-			if VDBOutputBuffer is not None:
-				VDBFindWindow(VDBOutputWindow)
-				vim.command("setlocal modifiable")
-				vim.command("normal G")
-				self.consoleprompt = VDBOutputBuffer[len(VDBOutputBuffer)-1]
-				vim.command("startinsert!")
+			self.ui.inputwanted(self)
 		else:
 			if self.state == INPUT:
 				self.state = READY
 		return ret
 	
-	def write(self, str):
+	def _discard(self):
+		del self.readbuffer[:]
+		self.readstart = 0
+		self.readscan = 0
 		self.buffer = ""
 		self.bufferwritepos = 0
-		self.sendpipe.write(str)
-		self.console[len(self.console)-1] += str
+
+	def write(self, str):
+		self._discard()
+		self.transport.write(str)
+		self.console.add(str)
 		debuglog(str,True)
-		time.sleep(0.01)
 
 	def writeline(self, str):
-		self.buffer = ""
-		self.bufferwritepos = 0
-		self.sendpipe.write(str+"\n")
-		self.console[len(self.console)-1] += str
-		self.console.append('')
+		#while running, the reader thread owns what comes back
+		if self.state != RUNNING:
+			self._discard()
+		self.transport.write(str+"\n")
+		self.console.addline(str)
 		debuglog(str)
-		time.sleep(0.01)
+
+	def _drainoutput(self):
+		self.transport.readoutput(self.output)
 
 	def getoutput(self):
-		try:
-			outputlines = self.outputpipe.read()
-			if outputlines == -1:
-				return None
-			else:
-				return outputlines
-		except IOError:
+		if self.state != RUNNING:
+			self._drainoutput()
+		if len(self.output) == 0:
 			return None
+		parts = []
+		while len(self.output) > 0:
+			parts.append(self.output.popleft())
+		return "".join(parts)
+
+	def getlogs(self):
+		if len(self.logs) == 0:
+			return None
+		lines = []
+		while len(self.logs) > 0:
+			lines.append(self.logs.popleft())
+		return lines
 	
-	def process(self, catch=False):
-		global VDBOutputWindow
-		global VDBOutputBuffer
+	def batch(self, commands):
+		"""sends the commands chained into as few lines as possible, returns
+		the lines that came back, which are taken out of the debug queue"""
+		separator = self.interface["separator"]
+		lines = []
+		#a command with the separator in it would be split up, so it goes on a
+		#line of its own, and nothing is chained after it
+		closed = True
+		for command in commands:
+			if not closed and separator not in command and len(lines[-1])+len(separator)+len(command) <= VDBBatchMaxChars:
+				lines[-1] += separator+command
+			else:
+				lines.append(command)
+				closed = separator in command
+		queued = len(self.debugqueue)
+		for line in lines:
+			self.writeline(line)
+			self.readlines()
+		responses = list(self.debugqueue)[queued:]
+		while len(self.debugqueue) > queued:
+			self.debugqueue.pop()
+		return responses
+
+	def setbreakpoints(self, locations):
+		"""sets a breakpoint at each file:line location in one batch, returns
+		the debugger's number for each, or None where it was refused"""
+		results = []
+		for response in self.batch([self.interface["breakcommand"]%(location) for location in locations]):
+			m = self.breakresult.match(response)
+			if m is not None:
+				results.append(int(m.group(1)))
+			elif self.breakerror.match(response):
+				results.append(None)
+		if len(results) != len(locations) and len(locations) > 1:
+			#couldn't tell which reply went with which breakpoint, so the ones
+			#that were set go again, and each is set on its own
+			self.batch([self.interface["clearcommand"]%(number) for number in results if number is not None])
+			results = [self.setbreakpoints([location])[0] for location in locations]
+		return (results+[None]*len(locations))[:len(locations)]
+
+	def configure(self, breakpoints):
+		"""gives each of the (number, TBreakpoint) pairs the debugger its
+		condition, hit count and log message, in one batch, returns the number
+		of each after, or None where the debugger refused"""
+		commands = []
+		for (number, breakpoint) in breakpoints:
+			ignore = max(breakpoint.hits-1, 0)
+			if breakpoint.log != "":
+				#a logpoint never stops, so it counts its own hits
+				options = {"number": number, "log": breakpoint.log.encode("base64"), "condition": breakpoint.condition.encode("base64"), "ignore": ignore}
+				commands += [command%(options) for command in self.interface["logcommands"]]
+				ignore = 0
+			else:
+				commands.append(self.interface["conditioncommand"]%(number, breakpoint.condition))
+			commands.append(self.interface["ignorecommand"]%(number, ignore))
+		self.batch(commands)
+		return [number for (number, breakpoint) in breakpoints]
+
+	def evalwatches(self, watches):
+		"""evaluates all the watches, given as (expression, page) pairs, with a
+		single debugger command, returns a list of (ok, text) pairs in the same
+		order"""
+		limits = (VDBWatchMaxChars, VDBWatchMaxItems, VDBWatchMaxDepth)
+		cached = watches == self.watchlist and limits == self.watchlimits
+		while True:
+			if cached:
+				self.writeline(self.interface["watchcommand"]%(""))
+			else:
+				encoded = [(w.encode("base64"), page) for (w, page) in watches]
+				self.writeline(self.interface["watchcommand"]%("%r, %r"%(encoded, limits)))
+			self.readlines()
+			results = [(False, "No result") for w in watches]
+			replies = 0
+			while len(self.debugqueue) > 0:
+				m = self.watchresult.match(self.debugqueue.popleft())
+				if m is not None and int(m.group(1)) < len(results):
+					results[int(m.group(1))] = (m.group(2) == "ok", m.group(3))
+					replies += 1
+			#the program only has the list once it has answered for all of it
+			if replies == len(watches):
+				self.watchlist = list(watches)
+				self.watchlimits = limits
+				return results
+			self.watchlimits = None
+			if not cached:
+				return results
+			cached = False
+
+	def watchchildren(self, watch):
+		"""returns the expressions for the elements or attributes of watch"""
+		self.writeline(self.interface["childrencommand"]%(watch.encode("base64"), VDBWatchMaxItems))
+		self.readlines()
+		children = []
+		while len(self.debugqueue) > 0:
+			m = self.childresult.match(self.debugqueue.popleft())
+			if m is not None:
+				children.append(m.group(1))
+		return children
+
+	def backtrace(self):
+		"""returns the program's call stack as [filename, line, source] lists,
+		outermost first"""
+		self.writeline(self.interface["stackcommand"])
+		self.readlines()
+		frames = []
+		while len(self.debugqueue) > 0:
+			response = self.debugqueue.popleft()
+			m = self.stackframe.match(response)
+			if m is not None:
+				frames.append([m.group(1), int(m.group(2)), ""])
+				continue
+			m = self.stacksource.match(response)
+			if m is not None and len(frames) > 0:
+				frames[-1][2] = m.group(1)
+		for i in range(len(frames)-1, -1, -1):
+			if frames[i][0] == self.interface["stackbottom"]:
+				return frames[i+1:]
+		return frames
 
+	def process(self, catch=False):
+		#the program's output is flushed before the debugger prompts, so once
+		#the prompt is in it's all there
+		self.readlines()
 		output = self.getoutput()
 		if output is not None:
-			if VDBOutputWindow is None:
-				vim.command("silent %inew %s"%(vim.current.window.height/2, "[Process Output]"))
-				vim.command("setlocal buftype=nofile nowrap noautoindent nobuflisted tw=0 nomodifiable")
-				vim.command("autocmd InsertLeave <buffer> setlocal nomodifiable")
-				VDBOutputWindow = vim.current.window
-				VDBOutputBuffer = vim.current.buffer
-				vim.command("nmap <silent> <buffer> i :python VDBInputInsert()<CR>")
-				vim.command("imap <silent> <buffer> <Bs> <C-\><C-O>:python VDBConsoleKeystroke(0)<CR>")
-				vim.command("imap <silent> <buffer> <Left> <C-\><C-O>:python VDBConsoleKeystroke(1)<CR>")
-				vim.command("imap <silent> <buffer> <C-Left> <C-\><C-O>:python VDBConsoleKeystroke(1)<CR>")
-				vim.command("imap <silent> <buffer> <S-Left> <C-\><C-O>:python VDBConsoleKeystroke(1)<CR>")
-				vim.command("imap <silent> <buffer> <Home> <C-\><C-O>:python VDBConsoleKeystroke(2)<CR>")
-				vim.command("imap <silent> <buffer> <kHome> <C-\><C-O>:python VDBConsoleKeystroke(2)<CR>")
-				vim.command("inoremap <buffer> <CR> <C-\><C-O>:python VDBConsoleKeystroke(-1)<CR>")
-				for k in ["<Up>", "<Down>", "<S-Up>", "<S-Down>", "<S-Left>", "<S-Right>", "<C-Left>", "<C-Right>", "<C-Up>", "<C-Down>", "<PageUp>", "<PageDown>", "<kPageUp>", "<kPageDown>", "<kEnter>", "<C-w>"]:
-					vim.command("imap <silent> <buffer> %s <C-\><C-O>:python VDBConsoleKeystroke(-2)<CR>"%(k))
-				vim.command("autocmd BufLeave <buffer> python VDBOutputWindow = VDBWindowDeleted(VDBOutputWindow)")
-				vim.command("autocmd BufDelete <buffer> python VDBOutputBuffer = VDBOutputWindow = None")
-
-			VDBFindWindow(VDBOutputWindow)
-			vim.command("setlocal modifiable")
-			for c in output:
-				if c == "\n":
-					VDBOutputBuffer.append('')
-					vim.command("normal G$")
-				else:
-					VDBOutputBuffer[len(VDBOutputBuffer)-1] += c
-			vim.command("setlocal nomodifiable")
-		
-		self.readlines()
+			self.ui.showoutput(self, output)
+		logs = self.getlogs()
+		if logs is not None:
+			self.ui.showlogs(self, logs)
 		if self.autokill:
 			return
 
@@ -288,108 +1693,675 @@ class TVDBSession(object):
 			if catch:
 				if response != "":
 					self.catchline = response
-				del self.debugqueue[0]
+				self.debugqueue.popleft()
 				return
-			matched = False
-			for pair in self.interface["autoresponse"]:
-				m = re.match(pair[0],response)
-				if m is not None:
-					comm = pair[1]
-					if comm != "":
-						for i in range(len(m.groups())+1):
-							grp = m.group(i).rstrip().replace("'","\\'").replace("\"","\\\"")
-							comm = comm.replace("%%%i"%(i),grp)
-						exec comm in globals(), locals()
+			VDBTrace.enter("parse")
+			try:
+				found = self.autoresponse.match(response)
+				if found is not None:
+					(handler, groups) = found
+					if handler is not None:
+						handler(self, *groups)
 						if self.autokill:
 							return True
 						self.readlines()
-					matched = True
-					break
-			del self.debugqueue[0]
+			finally:
+				VDBTrace.leave()
+			self.debugqueue.popleft()
+
+class TMISession(TVDBSession):
+	"""a session with a debugger that speaks gdb/MI, whose replies are parsed
+	as records instead of being scraped. MI prompts after every command, even
+	one that has just set the program running, so the debugger only counts as
+	being at the prompt once every command sent has been answered and the
+	program has stopped again"""
+	def __init__(self, interface, VDBSourceFile, VDBArgs, ui=None, background=False):
+		self.pending = 0
+		self.running = False
+		self.lastline = None
+		self.runningresult = re.compile(interface["runningresult"])
+		self.stoppedresult = re.compile(interface["stoppedresult"])
+		#the variable object of each watch, and its value when last reported
+		self.variables = {}
+		self.values = {}
+		self.variablecount = itertools.count()
+		TVDBSession.__init__(self, interface, VDBSourceFile, VDBArgs, ui, background)
+
+	def _readline(self):
+		line = TVDBSession._readline(self)
+		if line is not None:
+			if line.rstrip() == self.interface["prompt"]:
+				self.pending = max(self.pending-1, 0)
+			elif self.runningresult.match(line):
+				self.running = True
+			elif self.stoppedresult.match(line):
+				self.running = False
+			self.lastline = line
+		return line
+
+	def atprompt(self):
+		return self.buffer == "" and self.pending == 0 and not self.running and self.lastline is not None and self.lastline.rstrip() == self.interface["prompt"]
+
+	def writeline(self, str):
+		self.pending += str.count("\n")+1
+		TVDBSession.writeline(self, str)
+
+	def results(self, responses):
+		"""the (class, results) of each result record among responses, there
+		is one per command"""
+		records = []
+		for response in responses:
+			record = VDBParseMIRecord(response)
+			if record is not None and record[0] == "^":
+				records.append(record[1:])
+		return records
+
+	def logline(self, text):
+		return text.decode("string_escape").replace("\n", "\\n")
+
+	def configure(self, breakpoints):
+		"""MI can't turn a breakpoint into a dprintf or back, so each one is
+		deleted and inserted again with its options, which gives it a new number.
+		A logpoint's {expression}s are printed with $_as_string, which needs gdb
+		built with python"""
+		commands = []
+		for (number, breakpoint) in breakpoints:
+			options = ""
+			if breakpoint.condition != "":
+				options += " -c %s"%(VDBQuoteMI(breakpoint.condition))
+			if breakpoint.hits > 1:
+				options += " -i %i"%(breakpoint.hits-1)
+			commands.append(self.interface["clearcommand"]%(number))
+			if breakpoint.log == "":
+				commands.append("-break-insert%s %s"%(options, VDBQuoteMI(breakpoint.location())))
+			else:
+				parts = VDBLogField.split(breakpoint.log)
+				format = "VDBLog %s\n"%("%s".join([text.replace("%", "%%") for text in parts[0::2]]))
+				arguments = [VDBQuoteMI("$_as_string(%s)"%(field)) for field in parts[1::2]]
+				commands.append("-dprintf-insert%s %s %s"%(options, VDBQuoteMI(breakpoint.location()), " ".join([VDBQuoteMI(format)]+arguments)))
+		records = self.results(self.batch(commands))
+		if len(records) != len(commands):
+			return [None for b in breakpoints]
+		numbers = []
+		for (result, record) in records[1::2]:
+			if result == "done" and record.has_key("bkpt"):
+				numbers.append(int(record["bkpt"]["number"]))
+			else:
+				numbers.append(None)
+		return numbers
+
+	def evalwatches(self, watches):
+		"""creates a variable object for each new watch and deletes those of
+		watches that have gone, then a single update reports every value that
+		has changed since, in one batch"""
+		commands = []
+		wanted = set([w for (w, page) in watches])
+		for w in self.variables.keys():
+			if w not in wanted:
+				commands.append("-var-delete %s"%(self.variables.pop(w)))
+				self.values.pop(w, None)
+		created = []
+		for w in sorted(wanted):
+			if not self.variables.has_key(w):
+				name = "vdb%i"%(self.variablecount.next())
+				commands.append("-var-create %s @ %s"%(name, VDBQuoteMI(w)))
+				created.append((w, name))
+		records = self.results(self.batch(commands+[self.interface["watchcommand"]]))
+		if len(records) != len(commands)+1:
+			return [(False, "No result") for w in watches]
+		for ((w, name), (result, record)) in zip(created, records[len(commands)-len(created):-1]):
+			if result == "done":
+				self.variables[w] = name
+				self.values[w] = (True, record.get("value", ""))
+			else:
+				self.values[w] = (False, "*** %s"%(record.get("msg", "")))
+		names = dict([(name, w) for (w, name) in self.variables.items()])
+		for change in records[-1][1].get("changelist", []):
+			w = names.get(change.get("name"))
+			if w is None:
+				continue
+			if change.get("in_scope") == "true":
+				self.values[w] = (True, change.get("value", ""))
+			elif change.get("in_scope") == "false":
+				self.values[w] = (False, "*** Not in scope")
+			else:
+				#gone for good, made again next time
+				self.batch(["-var-delete %s"%(self.variables.pop(w))])
+				self.values[w] = (False, "*** No longer valid")
+		results = []
+		for (w, page) in watches:
+			(ok, value) = self.values.get(w, (False, "No result"))
+			if len(value) > VDBWatchMaxChars*page:
+				value = value[:VDBWatchMaxChars*page]+"..."
+			results.append((ok, value))
+		return results
+
+	def watchchildren(self, watch):
+		name = self.variables.get(watch)
+		if name is None:
+			return []
+		records = self.results(self.batch([self.interface["childrencommand"]%(name)]))
+		if len(records) == 0:
+			return []
+		children = [child.get("name") for child in records[0][1].get("children", [])][:VDBWatchMaxItems]
+		paths = self.results(self.batch(["-var-info-path-expression %s"%(child) for child in children]))
+		#pseudo children like a C++ class's access specifiers have no expression
+		return [record["path_expr"] for (result, record) in paths if record.has_key("path_expr")]
+
+	def backtrace(self):
+		frames = []
+		for (result, record) in self.results(self.batch([self.interface["stackcommand"]])):
+			for frame in record.get("stack", []):
+				if frame.has_key("fullname") and frame.has_key("line"):
+					frames.append([frame["fullname"], int(frame["line"]), linecache.getline(frame["fullname"], int(frame["line"])).strip()])
+		frames.reverse()
+		return frames
+
+class TStandby(threading.Thread):
+	"""a session started ahead of time in a thread of its own, which the next
+	session on the same program and arguments takes over"""
+	def __init__(self, interface, sourcefile, args, background):
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+		self.interface = interface
+		self.sourcefile = sourcefile
+		self.args = args
+		self.background = background
+		#the program is compiled as the debugger starts, so editing it makes
+		#the standby stale
+		try:
+			self.mtime = os.path.getmtime(sourcefile)
+		except OSError:
+			self.mtime = None
+		self.session = None
+		self.start()
+
+	def run(self):
+		try:
+			session = eval(self.interface["session"])(self.interface, self.sourcefile, self.args, None, self.background)
+			if len(VDBPreimports) > 0 and self.interface["importcommand"] is not None:
+				session.batch([self.interface["importcommand"]%(", ".join(VDBPreimports))])
+			self.session = session
+		except (IOError, OSError), e:
+			debuglog("standby failed to start: %s"%(e))
+
+	def matches(self, interface, sourcefile, args, background):
+		try:
+			if os.path.getmtime(sourcefile) != self.mtime:
+				return False
+		except OSError:
+			return False
+		return (self.interface, self.sourcefile, self.args, self.background) == (interface, sourcefile, args, background)
+
+	def take(self, ui):
+		"""waits for the session to be up if need be, and hands it over"""
+		self.join()
+		session = self.session
+		self.session = None
+		if session is not None:
+			session.ui = ui
+		return session
+
+	def close(self):
+		self.join()
+		if self.session is not None:
+			self.session.close()
+			self.session = None
+
+class TSigns(object):
+	"""every sign vdb shows, by id and where it goes ("file=..." or
+	"buffer=..."), as the line and sign name it should be showing. Placing and
+	unplacing only changes what's wanted, apply() then brings Vim into step
+	with one Ex command for just the signs that differ from what it has"""
+	def __init__(self):
+		self.wanted = {}
+		self.placed = {}
+		self.batched = None
+
+	def place(self, id, where, line, name):
+		self.wanted[(id, where)] = (line, name)
+
+	def unplace(self, id, where):
+		self.wanted.pop((id, where), None)
+
+	def line(self, id, where):
+		sign = self.wanted.get((id, where))
+		if sign is None:
+			return None
+		return sign[0]
+
+	def moved(self, id, where, line):
+		"""notes that Vim has moved a sign along with the text it's on"""
+		for signs in [self.wanted, self.placed]:
+			if signs.has_key((id, where)):
+				signs[(id, where)] = (line, signs[(id, where)][1])
+
+	def clear(self, where):
+		"""unplaces every sign in where"""
+		for key in [key for key in self.wanted if key[1] == where]:
+			del self.wanted[key]
+
+	def forget(self, where):
+		"""notes that Vim has dropped the signs in where, because the buffer
+		was read in again or deleted"""
+		for key in [key for key in self.placed if key[1] == where]:
+			del self.placed[key]
+
+	def apply(self):
+		commands = []
+		for (id, where) in self.placed:
+			if not self.wanted.has_key((id, where)):
+				commands.append("silent! sign unplace %i %s"%(id, where))
+		for ((id, where), (line, name)) in self.wanted.items():
+			if self.placed.get((id, where)) != (line, name):
+				#placing an id that's already there just moves it
+				commands.append("sign place %i line=%i name=%s %s"%(id, line, name, where))
+		self.placed = dict(self.wanted)
+		if len(commands) == 0:
+			return
+		if self.batched is None:
+			self.batched = vim.eval("exists('*execute')") == "1"
+		if self.batched and len(commands) > 1:
+			vim.command("call execute([%s])"%(", ".join(["'%s'"%(command.replace("'", "''")) for command in commands])))
+		else:
+			for command in commands:
+				vim.command(command)
+
+VDBSigns = TSigns()
 
 class TBreakpoint(object):
-	def __init__(self, signnum, buffer, number):
+	def __init__(self, signnum, buffer, line):
 		self.signnum = signnum
 		self.buffer = buffer
-		self.number = number
+		self.line = line
 		self.condition = ""
+		#logpoints write this message, with its {expression}s filled in,
+		#instead of stopping
+		self.log = ""
+		#stops from this hit on, 0 or 1 for every hit
+		self.hits = 0
+
+	def location(self):
+		return "%s:%i"%(self.buffer, self.line)
+
+	def plain(self):
+		return self.condition == "" and self.log == "" and self.hits <= 1
+
+	def sign(self):
+		if self.log != "":
+			return "LogPoint"
+		elif self.plain():
+			return "BreakPoint"
+		return "CondBreakPoint"
+
+class TBreakpointStore(object):
+	"""the breakpoints by file and then line. Sign ids are handed out once and
+	never reused, the signs move with the text as the buffer is edited, and a
+	file's line index is brought back in step from them whenever the buffer
+	has changed since it was last looked at. Saved breakpoints are only read
+	in for a file once it is opened, or a session needs them all"""
+	def __init__(self):
+		self.files = {}
+		self.buffers = {}
+		self.ticks = {}
+		self.nextsign = 1
+		self.saved = None
+		self.path = None
+		self.dirty = False
+
+	def _saved(self):
+		if self.saved is None:
+			self.saved = {}
+			if VDBBreakpointFile is not None:
+				self.path = os.path.abspath(VDBBreakpointFile)
+				try:
+					for (filename, lines) in json.load(open(self.path)).items():
+						#files saved before logpoints and hit counts have just the line and condition
+						lines = [(list(entry)+[u"", 0])[:4] for entry in lines]
+						self.saved[filename.encode("utf-8")] = [(line, condition.encode("utf-8"), log.encode("utf-8"), hits) for (line, condition, log, hits) in lines]
+				except (IOError, ValueError):
+					pass
+		return self.saved
+
+	def _file(self, filename):
+		breakpoints = self.files.get(filename)
+		if breakpoints is None:
+			breakpoints = self.files[filename] = {}
+			for (line, condition, log, hits) in self._saved().pop(filename, []):
+				breakpoint = TBreakpoint(self.nextsign, filename, line)
+				(breakpoint.condition, breakpoint.log, breakpoint.hits) = (condition, log, hits)
+				self.nextsign += 1
+				breakpoints[line] = breakpoint
+		return breakpoints
+
+	def opened(self, filename, number):
+		"""shows the breakpoints of a buffer that has just been read in"""
+		self.buffers[filename] = number
+		VDBSigns.forget("file=%s"%(filename))
+		for breakpoint in self._file(filename).values():
+			self.place(breakpoint)
+		VDBSigns.apply()
+		self.ticks[filename] = vim.eval("getbufvar(%i, 'changedtick')"%(number))
+
+	def seen(self, filename, number):
+		"""notes the buffer filename is in, for a file that was loaded before
+		vdb was, and so was never opened() as far as the store knows"""
+		if self.buffers.get(filename) != number:
+			self.opened(filename, number)
+
+	def sync(self, filename):
+		"""re-indexes the breakpoints of filename by where their signs are now,
+		if its buffer has been edited since the last time"""
+		number = self.buffers.get(filename)
+		if number is None:
+			return
+		tick = vim.eval("getbufvar(%i, 'changedtick')"%(number))
+		if tick == self.ticks.get(filename):
+			return
+		self.ticks[filename] = tick
+		if tick == "":
+			del self.buffers[filename]
+			VDBSigns.forget("file=%s"%(filename))
+			return
+		vim.command("redir => g:VDBSignList")
+		vim.command("silent sign place buffer=%i"%(number))
+		vim.command("redir END")
+		signs = {}
+		for (line, sign) in re.findall("line=(\d+)\s+id=(\d+)", vim.eval("g:VDBSignList")):
+			signs[int(sign)] = int(line)
+		moved = {}
+		for breakpoint in self._file(filename).values():
+			line = signs.get(breakpoint.signnum, breakpoint.line)
+			if line in moved:
+				#the lines between them were deleted
+				self.unplace(breakpoint)
+				self.dirty = True
+				continue
+			if line != breakpoint.line:
+				VDBSigns.moved(breakpoint.signnum, "file=%s"%(filename), line)
+				breakpoint.line = line
+				self.dirty = True
+			moved[line] = breakpoint
+		self.files[filename] = moved
+		VDBSigns.apply()
+
+	def get(self, filename, line):
+		self.sync(filename)
+		return self._file(filename).get(line)
+
+	def all(self):
+		"""every breakpoint, reading in the saved ones for files not opened yet"""
+		for filename in list(self._saved()):
+			self._file(filename)
+		breakpoints = []
+		for filename in self.files:
+			self.sync(filename)
+			breakpoints += self.files[filename].values()
+		return breakpoints
+
+	def add(self, filename, line):
+		breakpoint = TBreakpoint(self.nextsign, filename, line)
+		self.nextsign += 1
+		self._file(filename)[line] = breakpoint
+		self.dirty = True
+		self.place(breakpoint)
+		return breakpoint
+
+	def remove(self, breakpoint):
+		self.unplace(breakpoint)
+		del self._file(breakpoint.buffer)[breakpoint.line]
+		self.dirty = True
+
+	def setoptions(self, breakpoint, condition, log, hits):
+		self.unplace(breakpoint)
+		(breakpoint.condition, breakpoint.log, breakpoint.hits) = (condition, log, hits)
+		self.place(breakpoint)
+		self.dirty = True
+
+	def place(self, breakpoint):
+		if breakpoint.buffer in self.buffers:
+			VDBSigns.place(breakpoint.signnum, "file=%s"%(breakpoint.buffer), breakpoint.line, breakpoint.sign())
+
+	def unplace(self, breakpoint):
+		VDBSigns.unplace(breakpoint.signnum, "file=%s"%(breakpoint.buffer))
+
+	def save(self):
+		if not self.dirty or VDBBreakpointFile is None:
+			return
+		if self.path is None:
+			self.path = os.path.abspath(VDBBreakpointFile)
+		for filename in self.files:
+			self.sync(filename)
+		breakpoints = dict(self._saved())
+		for (filename, lines) in self.files.items():
+			if len(lines) > 0:
+				breakpoints[filename] = sorted([[b.line, b.condition, b.log, b.hits] for b in lines.values()])
+		try:
+			if len(breakpoints) > 0:
+				json.dump(breakpoints, open(self.path, "w"), separators=(",", ":"))
+			elif os.path.exists(self.path):
+				os.remove(self.path)
+			self.dirty = False
+		except (IOError, OSError), e:
+			sys.stderr.write("Could not save breakpoints to %s: %s\n"%(self.path, e))
+
+VDBBreakpoints = TBreakpointStore()
+
+@VDBPhase("redraw")
+def VDBShowOutput(output):
+	state = VDBCurrentState
+
+	if state.outputwindow is None:
+		vim.command("silent %inew %s"%(vim.current.window.height/2, VDBBufferName("Process Output")))
+		vim.command("setlocal buftype=nofile bufhidden=hide nowrap noautoindent nobuflisted tw=0 nomodifiable")
+		vim.command("autocmd InsertLeave <buffer> setlocal nomodifiable")
+		state.outputwindow = vim.current.window
+		state.outputbuffer = vim.current.buffer
+		vim.command("nmap <silent> <buffer> i :python VDBInputInsert()<CR>")
+		vim.command("imap <silent> <buffer> <Bs> <C-\><C-O>:python VDBConsoleKeystroke(0)<CR>")
+		vim.command("imap <silent> <buffer> <Left> <C-\><C-O>:python VDBConsoleKeystroke(1)<CR>")
+		vim.command("imap <silent> <buffer> <C-Left> <C-\><C-O>:python VDBConsoleKeystroke(1)<CR>")
+		vim.command("imap <silent> <buffer> <S-Left> <C-\><C-O>:python VDBConsoleKeystroke(1)<CR>")
+		vim.command("imap <silent> <buffer> <Home> <C-\><C-O>:python VDBConsoleKeystroke(2)<CR>")
+		vim.command("imap <silent> <buffer> <kHome> <C-\><C-O>:python VDBConsoleKeystroke(2)<CR>")
+		vim.command("inoremap <buffer> <CR> <C-\><C-O>:python VDBConsoleKeystroke(-1)<CR>")
+		for k in ["<Up>", "<Down>", "<S-Up>", "<S-Down>", "<S-Left>", "<S-Right>", "<C-Left>", "<C-Right>", "<C-Up>", "<C-Down>", "<PageUp>", "<PageDown>", "<kPageUp>", "<kPageDown>", "<kEnter>", "<C-w>"]:
+			vim.command("imap <silent> <buffer> %s <C-\><C-O>:python VDBConsoleKeystroke(-2)<CR>"%(k))
+		vim.command("autocmd BufLeave <buffer> python VDBWindowLeft(%i, 'outputwindow')"%(state.number))
+		vim.command("autocmd BufDelete <buffer> python VDBBufferDeleted(%i, 'outputbuffer', 'outputwindow')"%(state.number))
+
+	VDBSetModifiable(state.outputbuffer, True)
+	VDBAppendOutput(state.outputbuffer, output)
+	VDBSetModifiable(state.outputbuffer, False)
+	VDBScrollToEnd(state.outputwindow)
+
+def VDBAppendOutput(buffer, output):
+	"""appends a batch of raw process output to buffer in one go, the first
+	piece continues the buffer's last (unterminated) line"""
+	lines = output.split("\n")
+	last = len(buffer)-1
+	lines[0] = buffer[last]+lines[0]
+	buffer[last:] = lines
+	if VDBOutputMaxLines > 0 and len(buffer) > VDBOutputMaxLines:
+		del buffer[:len(buffer)-VDBOutputMaxLines]
+
+@VDBPhase("redraw")
+def VDBShowLogs(lines):
+	"""appends a batch of lines written by logpoints to the [Log] window"""
+	state = VDBCurrentState
+
+	fresh = state.logbuffer is None
+	if state.logwindow is None:
+		#reopens the buffer if only its window was closed
+		vim.command("silent %inew %s"%(vim.current.window.height/5, VDBBufferName("Log")))
+		vim.command("setlocal buftype=nofile bufhidden=hide nowrap noautoindent nobuflisted tw=0 nomodifiable")
+		state.logwindow = vim.current.window
+		state.logbuffer = vim.current.buffer
+		if fresh:
+			vim.command("autocmd BufLeave <buffer> python VDBWindowLeft(%i, 'logwindow')"%(state.number))
+			vim.command("autocmd BufDelete <buffer> python VDBBufferDeleted(%i, 'logbuffer', 'logwindow')"%(state.number))
+
+	VDBSetModifiable(state.logbuffer, True)
+	if fresh:
+		state.logbuffer[:] = lines
+	else:
+		state.logbuffer.append(lines)
+	if VDBLogMaxLines > 0 and len(state.logbuffer) > VDBLogMaxLines:
+		del state.logbuffer[:len(state.logbuffer)-VDBLogMaxLines]
+	VDBSetModifiable(state.logbuffer, False)
+	VDBScrollToEnd(state.logwindow)
 
 def VDBGetInput(prompt="VDB>", default="", complete="file"):
-	if complete is None:
-		return vim.eval('input("%s","%s")'%(prompt, default))
-	else:
-		return vim.eval('input("%s","%s","%s")'%(prompt, default, complete))
+	#single quoted, where only a ' needs doubling, as a default such as a
+	#logpoint message can have anything in it
+	arguments = [prompt, default]
+	if complete is not None:
+		arguments.append(complete)
+	return vim.eval("input(%s)"%(", ".join(["'%s'"%(argument.replace("'", "''")) for argument in arguments])))
+
+def VDBWindowNumber(win):
+	for (i, w) in enumerate(vim.windows):
+		if w == win:
+			return i+1
+	return None
 
 def VDBFindWindow(win):
-	curwin = vim.current.window
-	while True:
-		if vim.current.window == win:
-			return True
-			break
-		vim.command("wincmd w")
-		if vim.current.window == curwin:
-			return False
-			break
+	if vim.current.window == win:
+		return True
+	number = VDBWindowNumber(win)
+	if number is None:
+		return False
+	vim.command("%iwincmd w"%(number))
+	return True
+
+def VDBSetModifiable(buffer, modifiable):
+	vim.command("call setbufvar(%i, '&modifiable', %i)"%(buffer.number, modifiable))
+
+def VDBScrollToEnd(win):
+	"""puts the cursor at the end of win's buffer, visiting it without
+	running any autocommands if it isn't the current window"""
+	if vim.current.window == win:
+		vim.command("normal! G$")
+		return
+	number = VDBWindowNumber(win)
+	if number is None:
+		return
+	current = VDBWindowNumber(vim.current.window)
+	vim.command("noautocmd %iwincmd w"%(number))
+	vim.command("normal! G$")
+	vim.command("noautocmd %iwincmd w"%(current))
 
 def VDBWindowDeleted(win):
 	if 'deleted' in repr(win):
 		return None
 	else:
 		return win
+
+#the autocommands on a session's buffers go through these with the number of
+#the session the buffer belongs to, which needn't be the current one
+
+def VDBWindowLeft(number, name):
+	"""forgets one of a session's windows if it's been closed"""
+	state = VDBSessionState(number)
+	if state is not None:
+		setattr(state, name, VDBWindowDeleted(getattr(state, name)))
+
+def VDBBufferDeleted(number, *names):
+	state = VDBSessionState(number)
+	if state is not None:
+		for name in names:
+			setattr(state, name, None)
+
+def VDBSourceLeft(number):
+	"""ends the current session when its source window is closed"""
+	state = VDBSessionState(number)
+	if state is VDBCurrentState and VDBWindowDeleted(state.sourcewindow) is None:
+		VDBKill()
 	
+def VDBFileBuffer(filename):
+	"""the number of the buffer filename is in, whatever path it was opened by,
+	or None if it isn't in one"""
+	path = os.path.realpath(filename)
+	number = VDBBufferNumbers.get(path)
+	if number is not None and vim.eval("bufexists(%i)"%(number)) == "1":
+		return number
+	for buffer in vim.buffers:
+		if buffer.name and os.path.realpath(buffer.name) == path:
+			VDBBufferNumbers[path] = buffer.number
+			return buffer.number
+	VDBBufferNumbers.pop(path, None)
+	return None
+
+def VDBShowFile(filename):
+	"""shows filename in the current window, by switching to the buffer it is
+	already in if there is one, rather than editing it, and returns the name Vim
+	has for it. The buffer switched away from is hidden, not unloaded, so
+	coming back to it doesn't read it in and set it up again either"""
+	if vim.current.buffer.name == filename:
+		return filename
+	number = VDBFileBuffer(filename)
+	if number is None:
+		vim.command("silent hide edit %s"%(filename))
+		VDBBufferNumbers[os.path.realpath(filename)] = vim.current.buffer.number
+	elif number != vim.current.buffer.number:
+		vim.command("silent hide buffer %i"%(number))
+	return vim.current.buffer.name
+
+@VDBPhase("signs")
 def VDBShowExecution(filename, lineno, result=None, error=None):
+	"""moves the execution sign, the signs are only changed in Vim once the
+	watches have been brought up to date as well, by VDBUpdateWatches"""
 	global VDBExecFilename
-	global VDBBreakpoint
+	global VDBExecLine
+	global VDBStack
 	
 	if VDBExecFilename is not None:
-		vim.command("silent sign jump 65535 file=%s"%(VDBExecFilename))
-		vim.command("sign unplace 65535 file=%s"%(VDBExecFilename))
-		key = "%s:%i"%(vim.current.buffer.name, vim.current.window.cursor[0])
-		if VDBBreakpoint.has_key(key):
-			if VDBBreakpoint[key].condition == "":
-				vim.command("sign place %i line=%i name=BreakPoint file=%s"%(VDBBreakpoint[key].signnum,vim.current.window.cursor[0],VDBBreakpoint[key].buffer))
-			else:
-				vim.command("sign place %i line=%i name=CondBreakPoint file=%s"%(VDBBreakpoint[key].signnum,vim.current.window.cursor[0],VDBBreakpoint[key].buffer))
+		VDBSigns.unplace(VDBExecSign, "file=%s"%(VDBExecFilename))
+		breakpoint = VDBBreakpoints.get(VDBExecFilename, VDBExecLine)
+		if breakpoint is not None:
+			VDBBreakpoints.place(breakpoint)
 	
-	if not VDBFindWindow(VDBSourceWindow):
+	if not VDBFindWindow(VDBCurrentState.sourcewindow):
 		raise AssertionError("Yikes! The source window has disappeared!")
 		return
-	if VDBSourceWindow.buffer.name != filename:
-		vim.command("silent edit %s"%(filename))
+	#signs and breakpoints go by the name Vim knows the file by
+	filename = VDBShowFile(filename)
 	vim.command("setlocal nomodifiable")
 	if vim.current.buffer.number not in VDBSession.unmodifiablebuffers:
 		VDBSession.unmodifiablebuffers.append(vim.current.buffer.number)
 
 	if VDBSession.state == READY:
-		vim.command("sign place 65535 line=%i name=ExecutionLine file=%s"%(lineno,filename))
+		VDBSigns.place(VDBExecSign, "file=%s"%(filename), lineno, "ExecutionLine")
 	else:
-		vim.command("sign place 65535 line=%i name=ErrorLine file=%s"%(lineno,filename))
+		VDBSigns.place(VDBExecSign, "file=%s"%(filename), lineno, "ErrorLine")
 
 	VDBExecFilename = filename
-	vim.command("silent! sign jump 65535 file=%s"%(filename))
-	key = "%s:%i"%(vim.current.buffer.name, vim.current.window.cursor[0])
-	if VDBBreakpoint.has_key(key):
-		vim.command("sign unplace %i file=%s"%(VDBBreakpoint[key].signnum,VDBBreakpoint[key].buffer))
+	VDBExecLine = lineno
+	try:
+		vim.current.window.cursor = (lineno, 0)
+	except vim.error:
+		pass
+	breakpoint = VDBBreakpoints.get(filename, lineno)
+	if breakpoint is not None:
+		VDBBreakpoints.unplace(breakpoint)
 	vim.command("silent! foldopen")
-	if VDBSession.framecapture:
-		VDBSession.framecapture = False
-		VDBStack.append((VDBExecFilename, vim.current.window.cursor[0], vim.current.line))
+	VDBStack = None
 	if error is not None:
 		sys.stderr.write("%r\n"%(error))
 
+@VDBPhase("redraw")
 def VDBUpdateWatches():
 	global VDBSession
+	global VDBStack
 	global VDBWatches
-	global VDBWatchWindow
-	global VDBWatchBuffer
 
-	if VDBSession.state == INPUT:
+	if VDBSession.state in [INPUT, RUNNING]:
+		VDBSigns.apply()
 		return
-	if VDBStackWindow is not None:
-		win = vim.current.window
-		VDBFindWindow(VDBStackWindow)
-		vim.command("setlocal modifiable")
-		del vim.current.buffer[:]
+	if VDBCurrentState.stackwindow is not None:
+		#only fetched while it's on show, and once per stop
+		if VDBStack is None:
+			VDBStack = VDBSession.backtrace()
 		fw = 0
 		lw = 0
 		for frame in VDBStack:
@@ -397,77 +2369,135 @@ def VDBUpdateWatches():
 				fw = len(frame[0])
 			if math.log(frame[1],10) > lw:
 				lw = math.log(frame[1],10)
-		for frame in VDBStack:
-			line = "%%-%is %%%ii: %%s"%(fw+3, lw+1)
-			vim.current.buffer.append(line%frame)
-		vim.command("normal ggdd")
-		vim.command("setlocal nomodifiable")
-		VDBFindWindow(win)
+		line = "%%-%is %%%ii: %%s"%(fw+3, lw+1)
+		VDBSetModifiable(VDBCurrentState.stackwindow.buffer, True)
+		VDBCurrentState.stackwindow.buffer[:] = [line%tuple(frame) for frame in VDBStack]
+		VDBSetModifiable(VDBCurrentState.stackwindow.buffer, False)
 
 	if len(VDBWatches) == 0:
-		if VDBWatchWindow is not None:
-			VDBFindWindow(VDBWatchWindow)
+		if VDBCurrentState.watchwindow is not None:
+			VDBFindWindow(VDBCurrentState.watchwindow)
 			vim.command("wincmd c")
 	else:
-		if (VDBWatchBuffer is None) or (VDBWatchWindow is None):
+		if (VDBCurrentState.watchbuffer is None) or (VDBCurrentState.watchwindow is None):
 			win = vim.current.window
-			vim.command("silent %inew %s"%(vim.current.window.height/5, "[Watches]"))
-			vim.command("setlocal buftype=nofile nowrap noautoindent nobuflisted tw=0")
-			VDBWatchWindow = vim.current.window
-			VDBWatchBuffer = vim.current.buffer
-			vim.command("autocmd BufLeave <buffer> python VDBWatchWindow = VDBWindowDeleted(VDBWatchWindow)")
-			vim.command("autocmd BufDelete <buffer> python VDBWatchBuffer = VDBWatchWindow = None")
+			vim.command("silent %inew %s"%(vim.current.window.height/5, VDBBufferName("Watches")))
+			vim.command("setlocal buftype=nofile bufhidden=hide nowrap noautoindent nobuflisted tw=0")
+			VDBCurrentState.watchwindow = vim.current.window
+			VDBCurrentState.watchbuffer = vim.current.buffer
+			VDBSigns.clear("buffer=%i"%(VDBCurrentState.watchbuffer.number))
+			del VDBWatchSigns[:]
+			vim.command("autocmd BufLeave <buffer> python VDBWindowLeft(%i, 'watchwindow')"%(VDBCurrentState.number))
+			vim.command("nnoremap <buffer> <silent> <CR> :python VDBWatchMore()<CR>")
+			vim.command("nnoremap <buffer> <silent> e :python VDBExpandWatch()<CR>")
+			vim.command("autocmd BufDelete <buffer> python VDBBufferDeleted(%i, 'watchbuffer', 'watchwindow')"%(VDBCurrentState.number))
 			VDBFindWindow(win)
 		
-		del VDBWatchBuffer[:]
-		count = 0
-		for w in VDBWatches:
-			if VDBSession is not None:
-				VDBSession.writeline("print %s"%(w))
-				VDBSession.process(catch=True)
-				VDBWatchBuffer[len(VDBWatchBuffer)-1] = "%s: %s"%(w, VDBSession.catchline)
-				count +=1
-				if count < len(VDBWatches):
-					VDBWatchBuffer.append("")
-			else:
-				VDBWatchBuffer[len(VDBWatchBuffer)-1] = "%s: Debug session not in progress"%(w)
-				count +=1
-				if count < len(VDBWatches):
-					VDBWatchBuffer.append("")
+		changed = []
+		if VDBSession is not None:
+			results = VDBSession.evalwatches([(w, VDBWatchPages.get(w, 1)) for w in VDBWatches])
+			lines = []
+			for (i, (w, r)) in enumerate(zip(VDBWatches, results)):
+				lines.append("%s: %s"%(w, r[1]))
+				if VDBWatchValues.has_key(w) and VDBWatchValues[w] != r[1]:
+					changed.append(i+1)
+				VDBWatchValues[w] = r[1]
+		else:
+			lines = ["%s: Debug session not in progress"%(w) for w in VDBWatches]
+		VDBSetLines(VDBCurrentState.watchbuffer, lines)
+		VDBMarkWatches(changed)
+	VDBSigns.apply()
 	
-	if VDBConsoleWindow is not None and VDBWindowDeleted(VDBConsoleWindow) is not None:
+	if VDBCurrentState.consolewindow is not None and VDBWindowDeleted(VDBCurrentState.consolewindow) is not None:
 		win = vim.current.window
 		VDBShowConsole(True)
 		VDBFindWindow(win)
 
+def VDBSetLines(buffer, lines):
+	"""makes buffer hold lines, only rewriting the lines that differ"""
+	old = buffer[:]
+	if len(old) > len(lines):
+		del buffer[len(lines):]
+	elif len(old) < len(lines):
+		buffer.append(lines[len(old):])
+	for i in range(min(len(old), len(lines))):
+		if old[i] != lines[i]:
+			buffer[i] = lines[i]
+
+def VDBMarkWatches(changed):
+	"""flags the watch lines whose value changed with the last step"""
+	if changed == VDBWatchSigns:
+		return
+	where = "buffer=%i"%(VDBCurrentState.watchbuffer.number)
+	for line in VDBWatchSigns:
+		VDBSigns.unplace(WATCHSIGN+line, where)
+	for line in changed:
+		VDBSigns.place(WATCHSIGN+line, where, line, "WatchChanged")
+	VDBWatchSigns[:] = changed
+
+def VDBInputWanted(session):
+	state = VDBCurrentState
+
+	if state.outputwindow is None and state.outputbuffer is not None:
+		vim.command("silent %inew %s"%(vim.current.window.height/2, VDBBufferName("Process Output")))
+		vim.command("setlocal buftype=nofile bufhidden=hide nowrap noautoindent nobuflisted tw=0 nomodifiable")
+		vim.command("autocmd InsertLeave <buffer> setlocal nomodifiable")
+		state.outputwindow = vim.current.window
+		state.outputbuffer = vim.current.buffer
+		vim.command("nmap <silent> <buffer> i :python VDBInputInsert()<CR>")
+		vim.command("imap <silent> <buffer> <Bs> <C-\><C-O>:python VDBConsoleKeystroke(0)<CR>")
+		vim.command("imap <silent> <buffer> <Left> <C-\><C-O>:python VDBConsoleKeystroke(1)<CR>")
+		vim.command("imap <silent> <buffer> <C-Left> <C-\><C-O>:python VDBConsoleKeystroke(1)<CR>")
+		vim.command("imap <silent> <buffer> <S-Left> <C-\><C-O>:python VDBConsoleKeystroke(1)<CR>")
+		vim.command("imap <silent> <buffer> <Home> <C-\><C-O>:python VDBConsoleKeystroke(2)<CR>")
+		vim.command("imap <silent> <buffer> <kHome> <C-\><C-O>:python VDBConsoleKeystroke(2)<CR>")
+		vim.command("inoremap <buffer> <CR> <C-\><C-O>:python VDBConsoleKeystroke(-1)<CR>")
+		for k in ["<Up>", "<Down>", "<S-Up>", "<S-Down>", "<S-Left>", "<S-Right>", "<C-Left>", "<C-Right>", "<C-Up>", "<C-Down>", "<PageUp>", "<PageDown>", "<kPageUp>", "<kPageDown>", "<kEnter>", "<C-w>"]:
+			vim.command("imap <silent> <buffer> %s <C-\><C-O>:python VDBConsoleKeystroke(-2)<CR>"%(k))
+		vim.command("autocmd BufLeave <buffer> python VDBWindowLeft(%i, 'outputwindow')"%(state.number))
+		vim.command("autocmd BufDelete <buffer> python VDBBufferDeleted(%i, 'outputbuffer', 'outputwindow')"%(state.number))
+	if state.outputbuffer is not None:
+		VDBFindWindow(state.outputwindow)
+		vim.command("setlocal modifiable")
+		vim.command("normal G")
+		session.consoleprompt = state.outputbuffer[len(state.outputbuffer)-1]
+		vim.command("startinsert!")
+
 def VDBInputInsert():
-	if VDBSession.state == INPUT:
+	if VDBSession.state in [INPUT, RUNNING]:
 		vim.command("setlocal modifiable")
 		vim.command("normal G")
 		vim.command("startinsert!")
 
+@VDBTraced("console")
+def VDBConsoleEnter():
+	if vim.current.window != VDBCurrentState.outputwindow:
+		win = vim.current.window
+	else:
+		vim.command("setlocal modifiable")
+		vim.current.buffer.append('')
+		vim.command("setlocal nomodifiable")
+		win = None
+	VDBSession.writeline(vim.current.line[len(VDBSession.consoleprompt):])
+	if VDBSession.state == RUNNING:
+		vim.command("stopinsert!")
+		return
+	VDBSession.process()
+	VDBUpdateWatches()
+	if win is not None:
+		VDBFindWindow(win)
+		vim.command("setlocal modifiable")
+		VDBSyncConsole(vim.current.buffer)
+		vim.command("normal G")
+		vim.command("startinsert!")
+	else:
+		vim.command("stopinsert!")
+
 def VDBConsoleKeystroke(key):
 	if key == -2:
 		return
 	if key == -1: #<CR> enter/return
-		if vim.current.window != VDBOutputWindow:
-			win = vim.current.window
-		else:
-			vim.command("setlocal modifiable")
-			vim.current.buffer.append('')
-			vim.command("setlocal nomodifiable")
-			win = None
-		VDBSession.writeline(vim.current.line[len(VDBSession.consoleprompt):])
-		VDBSession.process()
-		VDBUpdateWatches()
-		if win is not None:
-			VDBFindWindow(win)
-			vim.command("setlocal modifiable")
-			vim.current.buffer[:] = VDBSession.console
-			vim.command("normal G")
-			vim.command("startinsert!")
-		else:
-			vim.command("stopinsert!")
+		VDBConsoleEnter()
 		return
 	col = vim.current.window.cursor[1]
 	if key == 0: #<Bs> backspace
@@ -491,17 +2521,36 @@ def VDBConsoleKeystroke(key):
 			vim.command("normal h")
 	vim.command("setlocal modifiable")
 
+def VDBSyncConsole(buffer):
+	"""brings the console buffer up to date with the session transcript, by
+	rewriting its last (unfinished) line and appending whatever is new"""
+	state = VDBCurrentState
+
+	last = len(buffer)-1
+	start = 0
+	if state.consoleshown is not None:
+		start = state.consoleshown+last
+	(dropped, lines) = VDBSession.console.since(start)
+	if state.consoleshown is None or start < dropped:
+		#the buffer's last line is gone from the transcript, start again
+		buffer[:] = lines
+	else:
+		buffer[last:] = lines
+		if dropped > state.consoleshown:
+			del buffer[:dropped-state.consoleshown]
+	state.consoleshown = dropped
+
 def VDBShowConsole(suppressinsert = False):
-	global VDBConsoleWindow
 	if VDBSession is None:
 		VDBInitSession()
 		VDBSession.process()
-	if VDBConsoleWindow is None:
-		VDBFindWindow(VDBSourceWindow)
-		vim.command("silent! 10new [VDB Console]")
+		VDBSigns.apply()
+	if VDBCurrentState.consolewindow is None:
+		VDBFindWindow(VDBCurrentState.sourcewindow)
+		vim.command("silent! 10new %s"%(VDBBufferName("VDB Console")))
 		vim.command("setlocal buftype=nofile nowrap noautoindent nobuflisted bufhidden=delete tw=0")
 		vim.command("autocmd InsertLeave <buffer> setlocal nomodifiable")
-		VDBConsoleWindow = vim.current.window
+		VDBCurrentState.consolewindow = vim.current.window
 		vim.command("nmap <buffer> i :setlocal modifiable<CR>gi")
 		vim.command("imap <silent> <buffer> <Bs> <C-\><C-O>:python VDBConsoleKeystroke(0)<CR>")
 		vim.command("imap <silent> <buffer> <Left> <C-\><C-O>:python VDBConsoleKeystroke(1)<CR>")
@@ -512,29 +2561,37 @@ def VDBShowConsole(suppressinsert = False):
 		vim.command("inoremap <buffer> <CR> <C-\><C-O>:python VDBConsoleKeystroke(-1)<CR>")
 		for k in ["<Up>", "<Down>", "<S-Up>", "<S-Down>", "<S-Left>", "<S-Right>", "<C-Left>", "<C-Right>", "<C-Up>", "<C-Down>", "<PageUp>", "<PageDown>", "<kPageUp>", "<kPageDown>", "<kEnter>", "<C-w>"]:
 			vim.command("imap <silent> <buffer> %s <C-\><C-O>:python VDBConsoleKeystroke(-2)<CR>"%(k))
-		vim.command("autocmd BufLeave <buffer> python VDBConsoleWindow = VDBWindowDeleted(VDBConsoleWindow)")
-		vim.command("autocmd BufDelete <buffer> python VDBConsoleBuffer = VDBConsoleWindow = None")
+		vim.command("autocmd BufLeave <buffer> python VDBWindowLeft(%i, 'consolewindow')"%(VDBCurrentState.number))
+		vim.command("autocmd BufDelete <buffer> python VDBBufferDeleted(%i, 'consolewindow', 'consoleshown')"%(VDBCurrentState.number))
 	else:
-		VDBFindWindow(VDBConsoleWindow)
+		VDBFindWindow(VDBCurrentState.consolewindow)
 	vim.command("setlocal modifiable")
-	vim.current.buffer[:] = VDBSession.console
+	VDBSyncConsole(vim.current.buffer)
 	VDBSession.consoleprompt = vim.current.buffer[len(vim.current.buffer)-1]
 	vim.command("normal G$")
 	if not suppressinsert:
 		vim.command("startinsert!")
 
+class TVimUI(TSessionUI):
+	def showoutput(self, session, output):
+		VDBShowOutput(output)
+
+	def showlogs(self, session, lines):
+		VDBShowLogs(lines)
+
+	def inputwanted(self, session):
+		VDBInputWanted(session)
+
+	def showexecution(self, session, filename, lineno, result=None, error=None):
+		VDBShowExecution(filename, lineno, result=result, error=error)
+
 #returns True is there is a running session already, otherwise attempts to start a new session, then returns true
 #returns false if a new session cannot be started
 def VDBInitSession(ReInit = None):
 	global VDBSession
+	global VDBStandbySession
 	global VDBSourceFile
 	global VDBRuntimeArgStr
-	global VDBWatchWindow
-	global VDBWatchBuffer
-	global VDBOutputWindow
-	global VDBOutputBuffer
-	global VDBStackWindow
-	global VDBSourceWindow
 
 	if ReInit:
 		VDBKill()
@@ -557,21 +2614,32 @@ def VDBInitSession(ReInit = None):
 		except VimError:
 			print "Cannot start debugger whilst modified buffers are open"
 			return False
-		VDBWatchWindow = None
-		VDBWatchBuffer = None
-		VDBStackWindow = None
+		VDBCurrentState.watchwindow = None
+		VDBCurrentState.watchbuffer = None
+		VDBCurrentState.stackwindow = None
+		VDBCurrentState.logwindow = None
 		
-		VDBSession = TVDBSession(i,VDBSourceFile, VDBRuntimeArgStr)
+		background = VDBBackground and vim.eval("has('timers') && exists('*execute')") == "1"
+		if VDBStandbySession is not None and VDBStandbySession.matches(i, VDBSourceFile, VDBRuntimeArgStr, background):
+			VDBSession = VDBStandbySession.take(TVimUI())
+		VDBCloseStandby()
+		if VDBSession is None:
+			VDBSession = eval(i["session"])(i,VDBSourceFile, VDBRuntimeArgStr, TVimUI(), background)
+		for error in VDBSession.setuperrors:
+			sys.stderr.write("Setting up the debugger failed: %s\n"%(error))
+		if VDBStandby:
+			VDBStandbySession = TStandby(i, VDBSourceFile, VDBRuntimeArgStr, background)
 		
-		vim.command("silent edit %s"%(VDBSourceFile))
-		VDBSourceWindow = vim.current.window
-		vim.command("autocmd BufLeave <buffer> python if VDBWindowDeleted(VDBSourceWindow) is None: VDBKill()")
+		if i["sourceprogram"]:
+			vim.command("silent edit %s"%(VDBSourceFile))
+		VDBCurrentState.sourcewindow = vim.current.window
+		vim.command("autocmd BufLeave <buffer> python VDBSourceLeft(%i)"%(VDBCurrentState.number))
 		
-		vim.command("silent %inew %s"%(vim.current.window.height/5, "[Process Output]"))
-		vim.command("setlocal buftype=nofile nowrap noautoindent nobuflisted tw=0")
+		vim.command("silent %inew %s"%(vim.current.window.height/5, VDBBufferName("Process Output")))
+		vim.command("setlocal buftype=nofile bufhidden=hide nowrap noautoindent nobuflisted tw=0")
 		vim.command("autocmd InsertLeave <buffer> setlocal nomodifiable")
-		VDBOutputWindow = vim.current.window
-		VDBOutputBuffer = vim.current.buffer
+		VDBCurrentState.outputwindow = vim.current.window
+		VDBCurrentState.outputbuffer = vim.current.buffer
 		vim.command("nmap <silent> <buffer> i :python VDBInputInsert()<CR>")
 		vim.command("imap <silent> <buffer> <Bs> <C-\><C-O>:python VDBConsoleKeystroke(0)<CR>")
 		vim.command("imap <silent> <buffer> <Left> <C-\><C-O>:python VDBConsoleKeystroke(1)<CR>")
@@ -582,62 +2650,80 @@ def VDBInitSession(ReInit = None):
 		vim.command("inoremap <buffer> <CR> <C-\><C-O>:python VDBConsoleKeystroke(-1)<CR>")
 		for k in ["<Up>", "<Down>", "<S-Up>", "<S-Down>", "<S-Left>", "<S-Right>", "<C-Left>", "<C-Right>", "<C-Up>", "<C-Down>", "<PageUp>", "<PageDown>", "<kPageUp>", "<kPageDown>", "<kEnter>", "<C-w>"]:
 			vim.command("imap <silent> <buffer> %s <C-\><C-O>:python VDBConsoleKeystroke(-2)<CR>"%(k))
-		vim.command("autocmd BufLeave <buffer> python VDBOutputWindow = VDBWindowDeleted(VDBOutputWindow)")
-		vim.command("autocmd BufDelete <buffer> python VDBOutputBuffer = VDBOutputWindow = None")
-		del VDBOutputBuffer[:]
+		vim.command("autocmd BufLeave <buffer> python VDBWindowLeft(%i, 'outputwindow')"%(VDBCurrentState.number))
+		vim.command("autocmd BufDelete <buffer> python VDBBufferDeleted(%i, 'outputbuffer', 'outputwindow')"%(VDBCurrentState.number))
+		del VDBCurrentState.outputbuffer[:]
 
 		vim.command("wincmd w")
 		vim.command("wincmd w")
 
-		disable = []
-		for key in VDBBreakpoint:
-			VDBSession.writeline("break %s"%(key))
-			VDBSession.process()
-			if VDBSession.breaknum is None:
-				vim.command("sign unplace %i file=%s"%(VDBBreakpoint[key].signnum,VDBBreakpoint[key].buffer))
-				disable.append(key)
-				print "Breakpoint at %s is invalid, deleting ..."%(key)
-		for key in disable:
-			del VDBBreakpoint[key]
+		#the store holds every program's breakpoints, one this debugger refuses
+		#may be another's, so it's only left out of this session
+		breakpoints = VDBBreakpoints.all()
+		refused = []
+		configured = []
+		for (breakpoint, number) in zip(breakpoints, VDBSession.setbreakpoints([b.location() for b in breakpoints])):
+			if number is None:
+				refused.append(breakpoint.location())
+			else:
+				VDBSession.breaknumbers[breakpoint] = number
+				if not breakpoint.plain():
+					configured.append((number, breakpoint))
+		VDBConfigureBreakpoints(VDBSession, configured)
+		VDBSigns.apply()
+		if len(refused) > 0:
+			print "Breakpoints at %s could not be set, this session goes without them"%(", ".join(refused))
 			
-		vim.command("highlight ExecutionLine term=bold ctermbg=DarkGreen ctermfg=White")
-		vim.command("highlight ErrorLine term=inverse ctermbg=DarkRed ctermfg=Black")
-		vim.command("highlight StackLine term=inverse ctermbg=DarkBlue ctermfg=Black")
-		vim.command("highlight BreakPoint term=inverse ctermbg=DarkCyan ctermfg=Black")
-
-		vim.command("sign define ExecutionLine text==> texthl=ExecutionLine linehl=ExecutionLine")
-		vim.command("sign define ErrorLine text==> texthl=ErrorLine linehl=ErrorLine")
-		vim.command("sign define StackLine text=<> texthl=StackLine linehl=StackLine")
-		vim.command("sign define BreakPoint text=! texthl=BreakPoint linehl=BreakPoint")
-		vim.command("sign define CondBreakPoint text=? texthl=BreakPoint linehl=BreakPoint")
-
+		VDBDefineSigns()
 		return True
 	return True
 
-def VDBShowStack():
-	global VDBStackWindow
+def VDBCloseStandby():
+	global VDBStandbySession
+
+	if VDBStandbySession is not None:
+		VDBStandbySession.close()
+		VDBStandbySession = None
+
+def VDBDefineSigns():
+	vim.command("highlight ExecutionLine term=bold ctermbg=DarkGreen ctermfg=White")
+	vim.command("highlight ErrorLine term=inverse ctermbg=DarkRed ctermfg=Black")
+	vim.command("highlight StackLine term=inverse ctermbg=DarkBlue ctermfg=Black")
+	vim.command("highlight BreakPoint term=inverse ctermbg=DarkCyan ctermfg=Black")
+	vim.command("highlight WatchChanged term=bold cterm=bold ctermfg=Yellow")
 
-	if (VDBSession is not None) and (VDBStackWindow is None):
+	vim.command("sign define ExecutionLine text==> texthl=ExecutionLine linehl=ExecutionLine")
+	vim.command("sign define ErrorLine text==> texthl=ErrorLine linehl=ErrorLine")
+	vim.command("sign define StackLine text=<> texthl=StackLine linehl=StackLine")
+	vim.command("sign define BreakPoint text=! texthl=BreakPoint linehl=BreakPoint")
+	vim.command("sign define CondBreakPoint text=? texthl=BreakPoint linehl=BreakPoint")
+	vim.command("sign define LogPoint text=L texthl=BreakPoint")
+	vim.command("sign define WatchChanged text=* texthl=WatchChanged linehl=WatchChanged")
+
+def VDBShowStack():
+	if (VDBSession is not None) and (VDBCurrentState.stackwindow is None):
 		win = vim.current.window
-		vim.command("silent %inew %s"%(vim.current.window.height/5, "[Call Stack]"))
+		vim.command("silent %inew %s"%(vim.current.window.height/5, VDBBufferName("Call Stack")))
 		vim.command("setlocal buftype=nofile nowrap noautoindent nobuflisted tw=0")
-		VDBStackWindow = vim.current.window
-		vim.command("autocmd BufLeave <buffer> python VDBStackWindow = VDBWindowDeleted(VDBStackWindow)")
+		VDBCurrentState.stackwindow = vim.current.window
+		vim.command("autocmd BufLeave <buffer> python VDBWindowLeft(%i, 'stackwindow')"%(VDBCurrentState.number))
 		vim.command("nnoremap <buffer> <silent> <CR> :python VDBJumpToStackFrame()<CR>")
 		VDBFindWindow(win)
 		VDBUpdateWatches()
 	else:
-		if VDBFindWindow(VDBStackWindow):
+		if VDBFindWindow(VDBCurrentState.stackwindow):
 			vim.command("wincmd c")
-			VDBStackWindow = None
+			VDBCurrentState.stackwindow = None
 
 def VDBJumpToStackFrame():
+	if VDBStack is None or vim.current.window.cursor[0] > len(VDBStack):
+		return
 	frame = VDBStack[vim.current.window.cursor[0]-1]
-	VDBFindWindow(VDBSourceWindow)
-	if VDBSourceWindow.buffer.name != frame[0]:
-		vim.command("silent edit %s"%(frame[0]))
+	VDBFindWindow(VDBCurrentState.sourcewindow)
+	VDBShowFile(frame[0])
 	vim.command("%i"%(frame[1]))
 
+@VDBTraced("until")
 def VDBUntil():
 	global VDBSession
 	global VDBExecFilename
@@ -647,67 +2733,136 @@ def VDBUntil():
 	if VDBSession is None:
 		VDBInitSession()
 		VDBSession.process()
-		VDBFindWindow(VDBSourceWindow)
-	if vim.current.window != VDBSourceWindow:
+		VDBFindWindow(VDBCurrentState.sourcewindow)
+	if vim.current.window != VDBCurrentState.sourcewindow:
 		return
 	if VDBSession.state != READY:
 		return
-	VDBSession.writeline("break %s:%i"%(bufname, lineno))
-	VDBSession.process()
-	VDBSession.writeline("continue")
-	VDBSession.process()
-	VDBSession.writeline("clear %s:%i"%(bufname, lineno))
-	if VDBSession.process():
-		VDBKill()
-		return
-	VDBUpdateWatches()
-
-def VDBToggleBreak():
-	global VDBSession
-	global VDBBreakpoint
+	VDBResume(VDBSession.interface["untilcommand"]%("%s:%i"%(bufname, lineno)))
 
-	key = "%s:%i"%(vim.current.buffer.name, vim.current.window.cursor[0])
-	if VDBBreakpoint.has_key(key):
-		if VDBSession is not None:
-			VDBSession.writeline("clear %s"%(key))
-			VDBSession.process()
-		vim.command("sign unplace %i file=%s"%(VDBBreakpoint[key].signnum,VDBBreakpoint[key].buffer))
-		del VDBBreakpoint[key]
-	else:
-		if VDBSession is not None:
-			VDBSession.writeline("break %s"%(key))
-			VDBSession.process()
-			if VDBSession.breaknum is None:
-				print "Could not set break point"
-				return
-			VDBBreakpoint[key] = TBreakpoint(len(VDBBreakpoint)+1,vim.current.buffer.name,VDBSession.breaknum)
+def VDBBreakpointSessions():
+	"""the live sessions a breakpoint change goes to, the breakpoints are
+	shared by all of them. Returns None if the current one is running"""
+	if VDBSession is not None and VDBSession.state == RUNNING:
+		print "Can't change breakpoints while the program is running, interrupt it first"
+		return None
+	sessions = []
+	for state in VDBSessionStates:
+		session = state.session()
+		if session is None:
+			continue
+		if session.state == RUNNING:
+			print "Session %i is running, its breakpoints are left as they were"%(state.number)
+		else:
+			sessions.append(session)
+	return sessions
+
+def VDBCursorBreakpoint():
+	"""the breakpoint on the line the cursor is on, if any, and that line"""
+	filename = vim.current.buffer.name
+	line = vim.current.window.cursor[0]
+	VDBBreakpoints.seen(filename, vim.current.buffer.number)
+	return (VDBBreakpoints.get(filename, line), filename, line)
+
+def VDBAddBreakpoint(sessions, filename, line):
+	"""sets a breakpoint in every one of sessions, or none of them, returns
+	it, or None if one of them refused"""
+	numbers = [session.setbreakpoints(["%s:%i"%(filename, line)])[0] for session in sessions]
+	if None in numbers:
+		for (session, number) in zip(sessions, numbers):
+			if number is not None:
+				session.batch([session.interface["clearcommand"]%(number)])
+		print "Could not set break point"
+		return None
+	breakpoint = VDBBreakpoints.add(filename, line)
+	for (session, number) in zip(sessions, numbers):
+		session.breaknumbers[breakpoint] = number
+	return breakpoint
+
+def VDBConfigureBreakpoints(session, breakpoints):
+	"""gives session's debugger the condition, log message and hit count of
+	each of the (number, breakpoint) pairs, and keeps the numbers they end up
+	with"""
+	for ((number, breakpoint), configured) in zip(breakpoints, session.configure(breakpoints)):
+		if configured is None:
+			session.breaknumbers.pop(breakpoint, None)
+			print "Could not set up the breakpoint at %s"%(breakpoint.location())
 		else:
-			VDBBreakpoint[key] = TBreakpoint(len(VDBBreakpoint)+1,vim.current.buffer.name,-1)
+			session.breaknumbers[breakpoint] = configured
 
-		vim.command("sign place %i line=%i name=BreakPoint file=%s"%(len(VDBBreakpoint),vim.current.window.cursor[0],vim.current.buffer.name))
+def VDBSetBreakpointOptions(sessions, breakpoint, condition, log, hits):
+	VDBBreakpoints.setoptions(breakpoint, condition, log, hits)
+	VDBSigns.apply()
+	for session in sessions:
+		if session.breaknumbers.has_key(breakpoint):
+			VDBConfigureBreakpoints(session, [(session.breaknumbers[breakpoint], breakpoint)])
 
-def VDBBreakpointCondition():
-	global VDBSession
-	global VDBBreakpoint
+def VDBToggleBreak():
+	sessions = VDBBreakpointSessions()
+	if sessions is None:
+		return
+	(breakpoint, filename, line) = VDBCursorBreakpoint()
+	if breakpoint is not None:
+		for session in sessions:
+			if session.breaknumbers.has_key(breakpoint):
+				session.batch([session.interface["clearcommand"]%(session.breaknumbers.pop(breakpoint))])
+		VDBBreakpoints.remove(breakpoint)
+	else:
+		VDBAddBreakpoint(sessions, filename, line)
+	VDBSigns.apply()
 
-	key = "%s:%i"%(vim.current.buffer.name, vim.current.window.cursor[0])
-	if VDBBreakpoint.has_key(key):
-		VDBBreakpoint[key].condition = VDBGetInput("Condition: ", VDBBreakpoint[key].condition, None)
-		if VDBSession is not None:
-			VDBSession.writeline("condition %i %s"%(VDBBreakpoint[key].number,VDBBreakpoint[key].condition))
-			VDBSession.process()
-		vim.command("sign unplace %i file=%s"%(VDBBreakpoint[key].signnum,VDBBreakpoint[key].buffer))
-		if VDBBreakpoint[key].condition == "":
-			vim.command("sign place %i line=%i name=BreakPoint file=%s"%(VDBBreakpoint[key].signnum,vim.current.window.cursor[0],VDBBreakpoint[key].buffer))
-		else:
-			vim.command("sign place %i line=%i name=CondBreakPoint file=%s"%(VDBBreakpoint[key].signnum,vim.current.window.cursor[0],VDBBreakpoint[key].buffer))
+def VDBBreakpointCondition():
+	sessions = VDBBreakpointSessions()
+	if sessions is None:
+		return
+	breakpoint = VDBCursorBreakpoint()[0]
+	if breakpoint is not None:
+		VDBSetBreakpointOptions(sessions, breakpoint, VDBGetInput("Condition: ", breakpoint.condition, None), breakpoint.log, breakpoint.hits)
 	else:
 		print "No breakpoint to set condition for"
 
+def VDBLogpoint():
+	"""makes the breakpoint on the cursor's line a logpoint, which writes a
+	message to the [Log] window and carries on, rather than stopping, setting
+	one if there is none. An empty message makes it a breakpoint again"""
+	sessions = VDBBreakpointSessions()
+	if sessions is None:
+		return
+	(breakpoint, filename, line) = VDBCursorBreakpoint()
+	if breakpoint is None:
+		log = VDBGetInput("Log message, {expression} for values: ", "", None)
+		if log == "":
+			return
+		breakpoint = VDBAddBreakpoint(sessions, filename, line)
+		if breakpoint is None:
+			return
+	else:
+		log = VDBGetInput("Log message, {expression} for values: ", breakpoint.log, None)
+	VDBSetBreakpointOptions(sessions, breakpoint, breakpoint.condition, log, breakpoint.hits)
+
+def VDBBreakpointHits():
+	"""makes the breakpoint on the cursor's line only stop from its nth hit
+	on, counting from when this is set or a session starts"""
+	sessions = VDBBreakpointSessions()
+	if sessions is None:
+		return
+	breakpoint = VDBCursorBreakpoint()[0]
+	if breakpoint is None:
+		print "No breakpoint to set a hit count for"
+		return
+	hits = VDBGetInput("Stop from hit number: ", ["", str(breakpoint.hits)][breakpoint.hits > 1], None)
+	try:
+		hits = int(hits or "0")
+	except ValueError:
+		print "%s isn't a number"%(hits)
+		return
+	VDBSetBreakpointOptions(sessions, breakpoint, breakpoint.condition, breakpoint.log, hits)
+
+@VDBTraced("watch")
 def VDBAddWatch():
 	global VDBWatches
 
-	if vim.current.window == VDBWatchWindow: #buffer.name.endswith("[VDB %i: Watches]"%(os.getpid())):
+	if vim.current.window == VDBCurrentState.watchwindow: #buffer.name.endswith("[VDB %i: Watches]"%(os.getpid())):
 		newwatch = VDBGetInput("New watch: ", vim.current.buffer[vim.current.window.cursor[0]-1].split(":")[0], None)
 		VDBWatches[vim.current.window.cursor[0]-1] = newwatch
 	else:
@@ -715,137 +2870,366 @@ def VDBAddWatch():
 		VDBWatches.append(newwatch)
 	VDBUpdateWatches()
 
+@VDBTraced("watch")
+def VDBWatchMore():
+	if vim.current.window == VDBCurrentState.watchwindow:
+		line = vim.current.window.cursor[0]-1
+		if line < len(VDBWatches):
+			VDBWatchPages[VDBWatches[line]] = VDBWatchPages.get(VDBWatches[line], 1)+1
+			VDBUpdateWatches()
+
+@VDBTraced("watch")
+def VDBExpandWatch():
+	if vim.current.window == VDBCurrentState.watchwindow and VDBSession is not None and VDBSession.state == READY:
+		line = vim.current.window.cursor[0]-1
+		if line < len(VDBWatches):
+			children = [c for c in VDBSession.watchchildren(VDBWatches[line]) if c not in VDBWatches]
+			VDBWatches[line+1:line+1] = children
+			VDBUpdateWatches()
+
 def VDBMoveWatchUp():
 	global VDBWatches
 
-	if vim.current.window == VDBWatchWindow: #buffer.name.endswith("[VDB %i: Watches]"%(os.getpid())):
+	if vim.current.window == VDBCurrentState.watchwindow: #buffer.name.endswith("[VDB %i: Watches]"%(os.getpid())):
 		line = vim.current.window.cursor[0]-1
 		if line > 0:
 			temp = vim.current.buffer[line-1]
 			vim.current.buffer[line-1] = vim.current.buffer[line]
 			vim.current.buffer[line] = temp
+			VDBWatches[line-1:line+1] = [VDBWatches[line], VDBWatches[line-1]]
 			vim.command("normal k")
 
 def VDBMoveWatchDown():
 	global VDBWatches
 
-	if vim.current.window == VDBWatchWindow: #buffer.name.endswith("[VDB %i: Watches]"%(os.getpid())):
+	if vim.current.window == VDBCurrentState.watchwindow: #buffer.name.endswith("[VDB %i: Watches]"%(os.getpid())):
 		line = vim.current.window.cursor[0]-1
 		if line < len(VDBWatches)-1:
 			temp = vim.current.buffer[line+1]
 			vim.current.buffer[line+1] = vim.current.buffer[line]
 			vim.current.buffer[line] = temp
+			VDBWatches[line:line+2] = [VDBWatches[line+1], VDBWatches[line]]
 			vim.command("normal j")
 
+@VDBTraced("watch")
 def VDBDelWatch():
 	global VDBWatches
 
-	if vim.current.window == VDBWatchWindow: #buffer.name.endswith("[VDB %i: Watches]"%(os.getpid())):
+	if vim.current.window == VDBCurrentState.watchwindow: #buffer.name.endswith("[VDB %i: Watches]"%(os.getpid())):
 		del VDBWatches[vim.current.window.cursor[0]-1]
 		VDBUpdateWatches()
 
-def VDBStepInto():
+def VDBStepCommand(name, count):
+	"""the debugger command that takes count steps of the kind name, with only
+	the last one reported"""
+	if count > 1:
+		return VDBSession.interface["%scountcommand"%(name)]%(count)
+	return VDBSession.interface["%scommand"%(name)]
+
+@VDBTraced("step")
+def VDBStepInto(count=1):
 	global VDBSession
 
 	if VDBSession is None:
 		VDBInitSession()
+		VDBStopped()
 	else:
-		if vim.current.window != VDBSourceWindow:
+		if vim.current.window != VDBCurrentState.sourcewindow:
 			return
 		if VDBSession.state != READY:
 			return
-		VDBSession.writeline("step")
-	if VDBSession.process():
-		VDBKill()
-		return
-	VDBUpdateWatches()
+		VDBResume(VDBStepCommand("step", count))
 
-def VDBStepOver():
+@VDBTraced("next")
+def VDBStepOver(count=1):
 	global VDBSession
 
 	if VDBSession is None:
 		VDBInitSession()
+		VDBStopped()
 	else:
-		if vim.current.window != VDBSourceWindow:
+		if vim.current.window != VDBCurrentState.sourcewindow:
 			return
 		if VDBSession.state != READY:
 			return
-		VDBSession.writeline("next")
-	if VDBSession.process():
-		VDBKill()
-		return
-	VDBUpdateWatches()
+		VDBResume(VDBStepCommand("next", count))
 
+@VDBTraced("return")
 def VDBFinish():
 	global VDBSession
 
 	if VDBInitSession():
-		if vim.current.window != VDBSourceWindow:
+		if vim.current.window != VDBCurrentState.sourcewindow:
 			return
 		if VDBSession.state != READY:
 			return
-		VDBSession.writeline("return")
-	if VDBSession.process():
-		VDBKill()
-		return
-	VDBUpdateWatches()
+		VDBResume(VDBSession.interface["returncommand"])
 
+@VDBTraced("continue")
 def VDBContinue():
 	global VDBSession
 
 	if VDBSession is None:
 		VDBInitSession()
+		VDBStopped()
 	else:
-		if vim.current.window != VDBSourceWindow:
+		if vim.current.window != VDBCurrentState.sourcewindow:
 			return
 		if VDBSession.state != READY:
 			return
-		VDBSession.writeline("continue")
+		VDBResume(VDBSession.interface["continuecommand"])
+
+def VDBResume(command):
+	"""sends a command that sets the program running, and either leaves it to
+	run in the background or waits for it to stop"""
+	if VDBSession.background:
+		VDBSession.resume(command)
+		#the command is timed up to the stop, by VDBStopped
+		VDBTrace.suspend(VDBSession)
+		vim.command("let g:VDBState = 'running'")
+		vim.command("echo 'Running, :VDBInterrupt to break in'")
+		VDBStartPolling()
+	else:
+		VDBSession.writeline(command)
+		VDBStopped()
+
+@VDBTraced("stop", resumes=True)
+def VDBStopped():
+	vim.command("let g:VDBState = 'stopped'")
 	if VDBSession.process():
 		VDBKill()
 		return
 	VDBUpdateWatches()
 
+def VDBStartPolling():
+	global VDBPollTimer
+
+	if VDBPollTimer is None:
+		vim.command("call execute(['function! VDBPollTimer(timer)', 'python VDBPoll()', 'endfunction'])")
+		VDBPollTimer = int(vim.eval("timer_start(%i, 'VDBPollTimer', {'repeat': -1})"%(VDBPollInterval)))
+
+def VDBStopPolling():
+	global VDBPollTimer
+
+	if VDBPollTimer is not None:
+		vim.command("call timer_stop(%i)"%(VDBPollTimer))
+		VDBPollTimer = None
+
+def VDBPollingWanted():
+	"""whether a program is running in the background that the timer still
+	has to look out for, the current session's or one that's switched away
+	from and hasn't been seen to stop yet"""
+	for state in VDBSessionStates:
+		session = state.session()
+		if session is not None and session.state == RUNNING and (state is VDBCurrentState or not state.announced):
+			return True
+	return False
+
+def VDBPoll():
+	"""called from a timer while the program runs in the background, shows its
+	output as it arrives and picks up where the command left off once the
+	debugger has stopped it. Other sessions' programs only get a message when
+	they stop, their output waits in their queues until they're switched to"""
+	for state in VDBSessionStates:
+		session = state.session()
+		if state is not VDBCurrentState and session is not None and session.state == RUNNING and not state.announced and session.stopped.isSet():
+			state.announced = True
+			vim.command("echo 'Session %i has stopped, :VDBSwitch %i to see where'"%(state.number, state.number))
+	if VDBSession is None or VDBSession.state != RUNNING:
+		if not VDBPollingWanted():
+			VDBStopPolling()
+		return
+	output = VDBSession.getoutput()
+	logs = VDBSession.getlogs()
+	if output is not None or logs is not None:
+		win = vim.current.window
+		if output is not None:
+			VDBShowOutput(output)
+		if logs is not None:
+			VDBShowLogs(logs)
+		VDBFindWindow(win)
+	if VDBSession.stopped.isSet():
+		VDBSession.stopped.clear()
+		VDBSession.state = READY
+		if not VDBPollingWanted():
+			VDBStopPolling()
+		vim.command("echo ''")
+		VDBStopped()
+
+def VDBInterrupt():
+	if VDBSession is not None and VDBSession.state == RUNNING:
+		VDBSession.interrupt()
+
 def VDBKill():
-	global VDBStackWindow
-	global VDBConsoleWindow
-	global VDBWatchWindow
-	global VDBWatchBuffer
-	global VDBOutputWindow
-	global VDBOutputBuffer
 	global VDBSession
 	global VDBExecFilename
 	global VDBStack
 
+	state = VDBCurrentState
+
 	if VDBSession is not None:
-		if VDBFindWindow(VDBStackWindow):
-			vim.command("bdelete")
-		if VDBFindWindow(VDBConsoleWindow):
-			vim.command("bdelete")
-		if VDBFindWindow(VDBWatchWindow):
-			vim.command("bdelete")
-		elif VDBWatchBuffer is not None:
-			vim.command("silent! bdelete %i"%(VDBWatchBuffer.number))
-		if VDBFindWindow(VDBOutputWindow):
-			vim.command("bdelete")
-		elif VDBOutputBuffer is not None:
-			vim.command("silent! bdelete %i"%(VDBOutputBuffer.number))
-		VDBStackWindow = None
-		VDBConsoleWindow = None
-		VDBWatchWindow = None
-		VDBWatchBuffer = None
-		VDBOutputWindow = None
-		VDBOutputBuffer = None
+		for win in [state.stackwindow, state.consolewindow]:
+			if VDBWindowNumber(win) is not None:
+				vim.command("bdelete %i"%(win.buffer.number))
+		if state.watchbuffer is not None:
+			VDBSigns.clear("buffer=%i"%(state.watchbuffer.number))
+			VDBSigns.forget("buffer=%i"%(state.watchbuffer.number))
+			del VDBWatchSigns[:]
+		for buffer in [state.watchbuffer, state.outputbuffer, state.logbuffer]:
+			if buffer is not None:
+				vim.command("silent! bdelete %i"%(buffer.number))
+		state.stackwindow = None
+		state.consolewindow = None
+		state.watchwindow = None
+		state.watchbuffer = None
+		state.outputwindow = None
+		state.outputbuffer = None
+		state.logwindow = None
+		state.logbuffer = None
 	
-		VDBFindWindow(VDBSourceWindow)
+		VDBFindWindow(state.sourcewindow)
 		for b in VDBSession.unmodifiablebuffers:
 			vim.command("silent! buffer %i"%(b))
 			vim.command("setlocal modifiable")
+		vim.command("let g:VDBState = ''")
+		VDBTrace.drop(VDBSession)
 		try:
+			VDBSession.close()
 			VDBSession = None
 		except IOError:
 			pass
-		VDBStack = []
+		if not VDBPollingWanted():
+			VDBStopPolling()
+		VDBStack = None
+		VDBTrace.flush()
+		VDBBreakpoints.save()
 		if VDBExecFilename is not None:
-			vim.command("sign unplace 65535 file=%s"%(VDBExecFilename))
+			VDBSigns.unplace(VDBExecSign, "file=%s"%(VDBExecFilename))
+			breakpoint = VDBBreakpoints.get(VDBExecFilename, VDBExecLine)
+			if breakpoint is not None:
+				VDBBreakpoints.place(breakpoint)
+			VDBSigns.apply()
 			VDBExecFilename = None
+
+def VDBHideSession():
+	"""closes the current session's windows, keeping their buffers, so
+	another session can be shown in their place"""
+	state = VDBCurrentState
+
+	for win in [state.stackwindow, state.consolewindow, state.watchwindow, state.outputwindow, state.logwindow]:
+		number = VDBWindowNumber(win)
+		if number is not None and len(vim.windows) > 1:
+			vim.command("silent! noautocmd %iclose"%(number))
+	state.stackwindow = None
+	state.consolewindow = None
+	state.consoleshown = None
+	state.watchwindow = None
+	state.outputwindow = None
+	state.logwindow = None
+
+def VDBShowSession():
+	"""puts back the windows of the session that has just been switched to"""
+	state = VDBCurrentState
+
+	if not VDBFindWindow(state.sourcewindow):
+		state.sourcewindow = vim.current.window
+	if VDBExecFilename is not None:
+		vim.command("silent! sign jump %i file=%s"%(VDBExecSign, VDBExecFilename))
+	height = vim.current.window.height/5
+	if state.outputbuffer is not None:
+		vim.command("silent sbuffer %i"%(state.outputbuffer.number))
+		vim.command("resize %i"%(height))
+		state.outputwindow = vim.current.window
+		VDBFindWindow(state.sourcewindow)
+	if state.watchbuffer is not None:
+		vim.command("silent sbuffer %i"%(state.watchbuffer.number))
+		vim.command("resize %i"%(height))
+		state.watchwindow = vim.current.window
+		VDBFindWindow(state.sourcewindow)
+	if state.logbuffer is not None:
+		vim.command("silent sbuffer %i"%(state.logbuffer.number))
+		vim.command("resize %i"%(height))
+		state.logwindow = vim.current.window
+		VDBFindWindow(state.sourcewindow)
+
+	if VDBSession is None:
+		vim.command("let g:VDBState = ''")
+	elif VDBSession.state == RUNNING:
+		vim.command("let g:VDBState = 'running'")
+		state.announced = False
+		VDBStartPolling()
+	else:
+		vim.command("let g:VDBState = 'stopped'")
+
+def VDBNewSession():
+	"""starts another debug session alongside the current one, which is
+	hidden, and carries on running if it was, until it's switched back to"""
+	global VDBCurrentState
+
+	if VDBSession is not None:
+		previous = VDBCurrentState
+		VDBHideSession()
+		VDBCurrentState.save()
+		number = 1
+		while number in [state.number for state in VDBSessionStates]:
+			number += 1
+		VDBCurrentState = TSessionState(number)
+		VDBSessionStates.append(VDBCurrentState)
+		VDBCurrentState.restore()
+		if not VDBInitSession():
+			VDBSwitchSession(previous.number)
+			return
+	elif not VDBInitSession():
+		return
+	VDBStopped()
+
+def VDBSwitchSession(number=None):
+	"""shows the session with the given number in place of the current one,
+	or the next one along if no number is given"""
+	global VDBCurrentState
+
+	VDBSessionStates[:] = [state for state in VDBSessionStates if state is VDBCurrentState or state.session() is not None]
+	if number is None:
+		target = VDBSessionStates[(VDBSessionStates.index(VDBCurrentState)+1)%len(VDBSessionStates)]
+	else:
+		target = VDBSessionState(number)
+		if target is None:
+			print "No session %i"%(number)
+			return
+	if target is VDBCurrentState:
+		return
+	VDBHideSession()
+	VDBCurrentState.save()
+	if VDBSession is None:
+		VDBSessionStates.remove(VDBCurrentState)
+	VDBCurrentState = target
+	VDBCurrentState.restore()
+	VDBShowSession()
+
+def VDBListSessions():
+	for state in VDBSessionStates:
+		session = state.session()
+		if session is None:
+			status = "not started"
+		elif session.state == RUNNING:
+			status = "running"
+		else:
+			status = "stopped"
+		print "%s%i %s (%s)"%(" *"[state is VDBCurrentState], state.number, state.get("VDBSourceFile"), status)
+
+VDBDefineSigns()
+vim.command("augroup VDBBreakpoints")
+vim.command("autocmd!")
+vim.command("autocmd BufReadPost * python VDBBreakpoints.opened(vim.eval(\"expand('<afile>:p')\"), int(vim.eval(\"expand('<abuf>')\")))")
+vim.command("autocmd VimLeavePre * python VDBBreakpoints.save()")
+vim.command("autocmd VimLeavePre * python VDBCloseStandby()")
+vim.command("augroup END")
+vim.command("command! VDBStats python VDBStats()")
+vim.command("command! VDBInterrupt python VDBInterrupt()")
+vim.command("command! VDBNew python VDBNewSession()")
+vim.command("command! -nargs=? VDBSwitch python VDBSwitchSession(<args>)")
+vim.command("command! VDBSessions python VDBListSessions()")
+vim.command("command! VDBLogpoint python VDBLogpoint()")
+vim.command("command! VDBHits python VDBBreakpointHits()")
+vim.command("command! -count=1 VDBStep python VDBStepInto(<count>)")
+vim.command("command! -count=1 VDBNext python VDBStepOver(<count>)")
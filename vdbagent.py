@@ -0,0 +1,271 @@
+"""The far end of remote debugging with vdb. Run it on the machine the program
+is on, and set VDBRemote in Vim to the address it listens on:
+
+	python vdbagent.py localhost:7272
+	python vdbagent.py /tmp/vdbagent.socket
+
+Each connection from vdb gets a debugger of its own, started on a pty with the
+program's output split off through a fifo, the same way vdb does it locally.
+What the debugger writes is held back until it prompts, and sent along with any
+program output in one go, so a command only costs one round trip over the link.
+
+Anyone who can connect can run commands as the user the agent runs as, so only
+listen on localhost or a unix socket, and reach it from elsewhere through ssh:
+
+	ssh -L 7272:localhost:7272 host python vdbagent.py localhost:7272
+
+The program's files have to be at the same paths on both machines."""
+
+import os
+import pty
+import tty
+import json
+import zlib
+import errno
+import fcntl
+import struct
+import socket
+import select
+import signal
+import time
+import optparse
+
+ReadChunk = 65536
+
+#messages to and from vdb are a kind character, a flags byte (1 if the data is
+#zlib compressed) and the length of the data, followed by the data. This must
+#be kept in step with VDBFrame and TFrames in vdb.py
+FrameHeader = struct.Struct("!cBI")
+
+def frame(kind, data, compressmin):
+	flags = 0
+	if len(data) >= compressmin:
+		packed = zlib.compress(data, 1)
+		if len(packed) < len(data):
+			(data, flags) = (packed, 1)
+	return FrameHeader.pack(kind, flags, len(data))+data
+
+class TFrames(object):
+	"""cuts the stream of data from a socket up into (kind, data) frames"""
+	def __init__(self):
+		self.buffer = bytearray()
+
+	def feed(self, data):
+		self.buffer += data
+		frames = []
+		while len(self.buffer) >= FrameHeader.size:
+			(kind, flags, length) = FrameHeader.unpack(str(self.buffer[:FrameHeader.size]))
+			if len(self.buffer) < FrameHeader.size+length:
+				break
+			data = str(self.buffer[FrameHeader.size:FrameHeader.size+length])
+			del self.buffer[:FrameHeader.size+length]
+			if flags & 1:
+				data = zlib.decompress(data)
+			frames.append((kind, data))
+		return frames
+
+def closeonexec(fd):
+	fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+
+class TAgentSession(object):
+	"""one debugger, run for one connection from vdb"""
+	def __init__(self, connection, options):
+		self.connection = connection
+		self.options = options
+		self.frames = TFrames()
+		self.prompt = None
+		self.pid = None
+		self.master = None
+		self.outputpath = None
+		self.debugger = []
+		self.output = []
+		#when the oldest data still held back arrived
+		self.held = None
+
+	def start(self, request):
+		self.prompt = request["prompt"].encode("utf-8").rstrip()
+		argv = [arg.encode("utf-8") for arg in request["argv"]]
+		self.outputpath = "/tmp/vdba-%i"%(os.getpid())
+		if not os.path.exists(self.outputpath):
+			os.mkfifo(self.outputpath, 0644)
+		#see TPtyTransport in vdb.py
+		self.outputfd = os.open(self.outputpath, os.O_RDONLY | os.O_NONBLOCK)
+		self.outputkeepalive = os.open(self.outputpath, os.O_WRONLY)
+		for fd in [self.outputfd, self.outputkeepalive, self.connection.fileno()]:
+			closeonexec(fd)
+		(pid, master) = pty.fork()
+		if pid == 0:
+			attrs = tty.tcgetattr(1)
+			attrs[3] = attrs[3] & ~tty.ECHO
+			attrs[0] = attrs[0] & tty.IGNBRK
+			tty.tcsetattr(1, tty.TCSANOW, attrs)
+			os.execv(argv[0], argv)
+		self.pid = pid
+		self.master = master
+		closeonexec(master)
+		fcntl.fcntl(master, fcntl.F_SETFL, fcntl.fcntl(master, fcntl.F_GETFL) | os.O_NONBLOCK)
+		self.send([("P", json.dumps({"outputpath": self.outputpath, "pid": pid}))])
+
+	def send(self, frames):
+		self.connection.sendall("".join([frame(kind, data, self.options.compressmin) for (kind, data) in frames]))
+
+	def flush(self):
+		"""sends everything held back, the program's output first, as the
+		debugger prompting is what tells vdb the output is all there"""
+		frames = []
+		if len(self.output) > 0:
+			frames.append(("O", "".join(self.output)))
+		if len(self.debugger) > 0:
+			frames.append(("D", "".join(self.debugger)))
+		self.output = []
+		self.debugger = []
+		self.held = None
+		if len(frames) > 0:
+			self.send(frames)
+
+	def hold(self, data, into):
+		into.append(data)
+		if self.held is None:
+			self.held = time.time()
+
+	def readdebugger(self):
+		"""returns False once the debugger has gone"""
+		try:
+			data = os.read(self.master, ReadChunk)
+		except OSError, e:
+			if e.errno == errno.EAGAIN:
+				return True
+			data = ""
+		if data == "":
+			return False
+		self.hold(data, self.debugger)
+		#the prompt may have come in two reads
+		tail = "".join(self.debugger[-2:])[-len(self.prompt)-16:].rstrip()
+		if tail.endswith(self.prompt):
+			self.readoutput()
+			self.flush()
+		return True
+
+	def readoutput(self):
+		try:
+			data = os.read(self.outputfd, ReadChunk)
+			while data != "":
+				self.hold(data, self.output)
+				data = os.read(self.outputfd, ReadChunk)
+		except OSError:
+			pass
+
+	def write(self, data):
+		while len(data) > 0:
+			try:
+				written = os.write(self.master, data)
+			except OSError, e:
+				if e.errno != errno.EAGAIN:
+					raise
+				select.select([], [self.master], [])
+				continue
+			data = data[written:]
+
+	def receive(self):
+		"""acts on what vdb has sent, returns False once it's done with us"""
+		data = self.connection.recv(ReadChunk)
+		if data == "":
+			return False
+		for (kind, data) in self.frames.feed(data):
+			if kind == "S" and self.pid is None:
+				self.start(json.loads(data))
+			elif kind == "W" and self.pid is not None:
+				self.write(data)
+			elif kind == "I" and self.pid is not None:
+				os.kill(self.pid, signal.SIGINT)
+			elif kind == "C":
+				return False
+		return True
+
+	def run(self):
+		try:
+			while True:
+				fds = [self.connection]
+				if self.pid is not None:
+					fds += [self.master, self.outputfd]
+				timeout = None
+				if self.held is not None:
+					timeout = max(self.held+self.options.hold-time.time(), 0)
+				try:
+					(readable, writable, failed) = select.select(fds, [], [], timeout)
+				except select.error:
+					continue
+				if self.connection in readable and not self.receive():
+					break
+				if self.pid is not None:
+					if self.outputfd in readable:
+						self.readoutput()
+					if self.master in readable and not self.readdebugger():
+						self.readoutput()
+						self.flush()
+						break
+				#the debugger hasn't prompted, but the program's still running, or
+				#waiting for input, so what there is has to go anyway
+				if self.held is not None and time.time() >= self.held+self.options.hold:
+					self.flush()
+		except (IOError, OSError, socket.error):
+			pass
+		self.close()
+
+	def close(self):
+		if self.pid is not None:
+			#hanging up the pty is what ends a local session too
+			os.close(self.master)
+			try:
+				os.kill(self.pid, signal.SIGHUP)
+				os.waitpid(self.pid, 0)
+			except OSError:
+				pass
+			os.close(self.outputfd)
+			os.close(self.outputkeepalive)
+			os.remove(self.outputpath)
+		self.connection.close()
+
+def listen(address):
+	if ":" in address:
+		(host, port) = address.rsplit(":", 1)
+		listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		listener.bind((host, int(port)))
+	else:
+		if os.path.exists(address):
+			os.remove(address)
+		listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		listener.bind(address)
+		os.chmod(address, 0600)
+	listener.listen(5)
+	return listener
+
+def main():
+	parser = optparse.OptionParser(usage="%prog [options] host:port|socketpath")
+	parser.add_option("--compress-min", dest="compressmin", type="int", default=1024, help="compress messages at least this many bytes long")
+	parser.add_option("--hold", type="float", default=0.05, help="seconds to hold back output waiting for the debugger to prompt")
+	(options, args) = parser.parse_args()
+	if len(args) != 1:
+		parser.error("give the address to listen on")
+	listener = listen(args[0])
+	#sessions are forked off, and nobody waits for them
+	signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+	while True:
+		try:
+			(connection, peer) = listener.accept()
+		except socket.error, e:
+			if e.errno == errno.EINTR:
+				continue
+			raise
+		if connection.family == socket.AF_INET:
+			connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		if os.fork() == 0:
+			listener.close()
+			signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+			TAgentSession(connection, options).run()
+			os._exit(0)
+		connection.close()
+
+if __name__ == "__main__":
+	main()